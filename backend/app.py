@@ -1,24 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from models import Database, User, Product
 from scraper import PriceScraper
 from auth import generate_token, token_required
 from scheduler import PriceChecker
 from config import Config
+from link_resolver import ShortLinkResolver
+from response_cache import product_list_cache
+import structured_data
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 import re
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize database
-db = Database()
-
-# Initialize scraper
-scraper = PriceScraper()
-
-# Initialize and start price checker
-price_checker = PriceChecker()
-price_checker.start()
+# Parse workers (forkserver) re-import the main module as __mp_main__; they
+# only need the parsers, so services are not started there
+if __name__ != '__mp_main__':
+    # Initialize database
+    db = Database()
+    
+    # Initialize scraper
+    scraper = PriceScraper(resolver=ShortLinkResolver(db))
+    
+    # Initialize and start price checker
+    price_checker = PriceChecker()
+    price_checker.start()
 
 # Helper function to validate email
 def is_valid_email(email):
@@ -114,24 +122,76 @@ def login():
 @app.route('/api/products', methods=['GET'])
 @token_required
 def get_products():
-    """Get all products for logged-in user"""
+    """Get all products for logged-in user
+    
+    Optional ?limit=N&cursor=<id> paginate by product id. Responses carry a
+    strong ETag and are served from a per-user cache while the user's
+    product-list version in the database is unchanged.
+    """
     try:
-        products = Product.get_user_products(db, request.user_id)
-        
-        # Convert Decimal to float for JSON serialization
-        products_list = []
-        for p in products:
-            product_dict = dict(p)
-            if product_dict.get('current_price'):
-                product_dict['current_price'] = float(product_dict['current_price'])
-            if product_dict.get('target_price'):
-                product_dict['target_price'] = float(product_dict['target_price'])
-            products_list.append(product_dict)
+        limit = request.args.get('limit')
+        cursor = request.args.get('cursor')
+        try:
+            limit = int(limit) if limit is not None else None
+            cursor = int(cursor) if cursor is not None else None
+            if (limit is not None and not 1 <= limit <= Config.PRODUCT_PAGE_MAX_LIMIT) or (cursor is not None and cursor < 0):
+                raise ValueError
+        except ValueError:
+            return jsonify({
+                'error': f'limit must be between 1 and {Config.PRODUCT_PAGE_MAX_LIMIT} and cursor a product id'
+            }), 400
         
-        return jsonify({
-            'products': products_list,
-            'count': len(products_list)
-        }), 200
+        key = (cursor, limit)
+        # One primary-key read decides whether the cached render is still current
+        version = Product.list_version(db, request.user_id)
+        entry = product_list_cache.get(request.user_id, key, version)
+        
+        if entry is None:
+            products = Product.get_user_products(db, request.user_id, after_id=cursor, limit=limit)
+            
+            # Convert Decimal to float for JSON serialization
+            products_list = []
+            for p in products:
+                product_dict = dict(p)
+                if product_dict.get('current_price'):
+                    product_dict['current_price'] = float(product_dict['current_price'])
+                if product_dict.get('target_price'):
+                    product_dict['target_price'] = float(product_dict['target_price'])
+                products_list.append(product_dict)
+            
+            payload = {
+                'products': products_list,
+                'count': len(products_list)
+            }
+            if limit is not None:
+                payload['next_cursor'] = products_list[-1]['id'] if len(products_list) == limit else None
+            
+            body = app.json.dumps(payload).encode('utf-8')
+            entry = product_list_cache.put(request.user_id, key, body, version)
+        
+        # Each content-coding is its own representation, so gzip gets its own strong ETag
+        body, etag = entry['body'], entry['etag']
+        compress = len(body) >= Config.COMPRESS_MIN_BYTES and 'gzip' in request.accept_encodings
+        if compress:
+            etag += '-gzip'
+        
+        headers = {
+            'Cache-Control': 'private, no-cache',
+            'Vary': 'Accept-Encoding, Authorization'
+        }
+        
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+        
+        if compress:
+            body = product_list_cache.gzipped(entry)
+            headers['Content-Encoding'] = 'gzip'
+        
+        response = Response(body, status=200, mimetype='application/json', headers=headers)
+        response.set_etag(etag)
+        return response
     
     except Exception as e:
         return jsonify({'error': f'Failed to fetch products: {str(e)}'}), 500
@@ -201,6 +261,9 @@ def add_product():
                 # Mark alert as sent
                 Product.mark_alert_sent(db, product_id)
         
+        # The fresh price may also reach other users' targets for this item
+        price_checker.schedule_fan_out(url, result['price'], exclude_ids=[product_id])
+        
         return jsonify({
             'message': 'Product added successfully',
             'product': {
@@ -215,6 +278,192 @@ def add_product():
     except Exception as e:
         return jsonify({'error': f'Failed to add product: {str(e)}'}), 500
 
+@app.route('/api/products/bulk', methods=['POST'])
+@token_required
+def bulk_add_products():
+    """Add many products at once, streaming one NDJSON result line per item"""
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    
+    # Validation
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'A non-empty list of items is required'}), 400
+    
+    if len(items) > Config.BULK_IMPORT_MAX_ITEMS:
+        return jsonify({
+            'error': f'At most {Config.BULK_IMPORT_MAX_ITEMS} items can be imported at once'
+        }), 400
+    
+    user_id = request.user_id
+    user_email = request.user_email
+    
+    def generate():
+        def line(payload):
+            return json.dumps(payload) + '\n'
+        
+        limit_error = f'You have reached the maximum limit of {Config.MAX_PRODUCTS_PER_USER} products'
+        accepted = []
+        failed = 0
+        
+        for index, item in enumerate(items):
+            item = item if isinstance(item, dict) else {}
+            url = str(item.get('url') or '').strip()
+            target_price = item.get('target_price')
+            error = None
+            
+            if not url or not target_price:
+                error = 'URL and target price are required'
+            elif not is_valid_url(url):
+                error = 'Invalid URL format'
+            else:
+                try:
+                    target_price = float(target_price)
+                    if target_price <= 0:
+                        raise ValueError
+                except (ValueError, TypeError):
+                    error = 'Target price must be a positive number'
+            
+            if error:
+                failed += 1
+                yield line({'index': index, 'url': url, 'success': False, 'error': error})
+            else:
+                accepted.append((index, url, target_price))
+        
+        # Scrape each distinct URL once; dicts keep the input order
+        by_url = {}
+        for index, url, target_price in accepted:
+            by_url.setdefault(url, []).append((index, target_price))
+        
+        # The response has already started, so failures here end it with a summary
+        try:
+            # One quota query for the whole batch; create_many re-checks it on insert
+            remaining = max(0, Config.MAX_PRODUCTS_PER_USER - Product.count_user_products(db, user_id))
+        except Exception as e:
+            yield line({'error': f'Failed to start import: {str(e)}'})
+            yield line({'summary': {'added': 0, 'failed': len(items)}})
+            return
+        
+        # Scrape in input order, in waves no bigger than the free slots, and stop
+        # once they are filled, so an import never fetches far more than it adds
+        pending = list(by_url)
+        scraped = []
+        while pending and len(scraped) < remaining:
+            wave = []
+            wanted = remaining - len(scraped)
+            while pending and wanted > 0:
+                wave.append(pending.pop(0))
+                wanted -= len(by_url[wave[-1]])
+            
+            try:
+                if scraper.resolver:
+                    scraper.resolver.resolve_many(wave)
+            except Exception as e:
+                yield line({'error': f'Failed to resolve links: {str(e)}'})
+                yield line({'summary': {'added': 0, 'failed': len(items)}})
+                return
+            
+            # Concurrent within a wave; the scraper enforces per-site limits
+            results = {}
+            with ThreadPoolExecutor(max_workers=min(len(wave), Config.BULK_IMPORT_WORKERS)) as pool:
+                futures = {pool.submit(scraper.scrape, url): url for url in wave}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    result = results[url] = future.result()
+                    if not result['success']:
+                        # Report failures as soon as they are known
+                        for index, _ in by_url[url]:
+                            failed += 1
+                            yield line({
+                                'index': index,
+                                'url': url,
+                                'success': False,
+                                'error': result.get('error', 'Failed to fetch product details')
+                            })
+            
+            for url in wave:
+                result = results[url]
+                if not result['success']:
+                    continue
+                for index, target_price in by_url[url]:
+                    scraped.append((index, {
+                        'url': url,
+                        'target_price': target_price,
+                        'site_source': result['site'],
+                        'product_title': result['title'],
+                        'current_price': result['price']
+                    }))
+        
+        # Slots go to successful scrapes in input order; whatever is left, scraped
+        # or not, is over the limit
+        scraped.sort(key=lambda entry: entry[0])
+        over_limit = scraped[remaining:] + [
+            (index, {'url': url}) for url in pending for index, _ in by_url[url]
+        ]
+        to_create = scraped[:remaining]
+        
+        # Insert every scraped product in one transaction, which re-checks the quota
+        # in case another import for this user finished while we were scraping
+        try:
+            product_ids = Product.create_many(
+                db, user_id, [p for _, p in to_create], max_products=Config.MAX_PRODUCTS_PER_USER
+            )
+        except Exception as e:
+            for index, p in to_create:
+                yield line({'index': index, 'url': p['url'], 'success': False, 'error': f'Failed to add product: {str(e)}'})
+            yield line({'summary': {'added': 0, 'failed': failed + len(to_create) + len(over_limit)}})
+            return
+        
+        over_limit = to_create[len(product_ids):] + over_limit
+        to_create = to_create[:len(product_ids)]
+        for index, p in sorted(over_limit, key=lambda entry: entry[0]):
+            failed += 1
+            yield line({'index': index, 'url': p['url'], 'success': False, 'error': limit_error})
+        
+        alerts = [
+            (product_id, p) for product_id, (_, p) in zip(product_ids, to_create)
+            if p['current_price'] <= p['target_price']
+        ]
+        if alerts:
+            # Price is already below target for these; alert immediately like add_product
+            from email_service import EmailService
+            email_service = EmailService()
+            user = User.find_by_email(db, user_email)
+            if user:
+                for product_id, p in alerts:
+                    email_service.send_price_alert(
+                        to_email=user['email'],
+                        product_title=p['product_title'],
+                        current_price=p['current_price'],
+                        target_price=p['target_price'],
+                        product_url=p['url']
+                    )
+                    Product.mark_alert_sent(db, product_id)
+        
+        # The fresh prices may also reach other users' targets for these items
+        created_by_url = {}
+        for product_id, (_, p) in zip(product_ids, to_create):
+            created_by_url.setdefault(p['url'], (p['current_price'], []))[1].append(product_id)
+        for url, (price, ids) in created_by_url.items():
+            price_checker.schedule_fan_out(url, price, exclude_ids=ids)
+        
+        for product_id, (index, p) in zip(product_ids, to_create):
+            yield line({
+                'index': index,
+                'url': p['url'],
+                'success': True,
+                'product': {
+                    'id': product_id,
+                    'title': p['product_title'],
+                    'current_price': p['current_price'],
+                    'target_price': p['target_price'],
+                    'site': p['site_source']
+                }
+            })
+        
+        yield line({'summary': {'added': len(product_ids), 'failed': failed}})
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
 @token_required
 def delete_product(product_id):
@@ -233,6 +482,12 @@ def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy'}), 200
 
+@app.route('/api/scrape-stats', methods=['GET'])
+@token_required
+def scrape_stats():
+    """How often each extraction tier (structured data vs DOM) produced the price"""
+    return jsonify(structured_data.extraction_stats.snapshot()), 200
+
 @app.route('/api/scrape-test', methods=['POST'])
 @token_required
 def test_scrape():
@@ -6,6 +6,8 @@ load_dotenv()
 class Config:
     # Database
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///pricetracker.db')
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))  # PostgreSQL only
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
     
     # JWT Secret
     JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-this-in-production')
@@ -18,4 +20,30 @@ class Config:
     
     # App Configuration
     MAX_PRODUCTS_PER_USER = 5
-    PRICE_CHECK_INTERVAL = 3600  # 1 hour in seconds
\ No newline at end of file
+    BULK_IMPORT_MAX_ITEMS = 500
+    BULK_IMPORT_WORKERS = 16  # Concurrent scrapes per bulk import, still capped per site
+    
+    # GET /api/products response cache
+    PRODUCT_CACHE_MAX_USERS = 10000
+    PRODUCT_CACHE_MAX_PAGES = 8  # Cached pages per user (distinct cursor/limit pairs)
+    PRODUCT_PAGE_MAX_LIMIT = 100
+    COMPRESS_MIN_BYTES = 1024  # Smaller responses are sent uncompressed
+    PRICE_CHECK_INTERVAL = 3600  # 1 hour in seconds
+    PRICE_WRITE_BATCH_SIZE = 50  # Prices written back per bulk update during a sweep
+    # ~250 bytes per watcher in the target-price index (sorted arrays, id -> item map, item keys)
+    TARGET_INDEX_MAX_WATCHERS = 250000
+    
+    # Short link resolution (amzn.in, dl.flipkart.com)
+    SHORT_LINK_TTL = 30 * 24 * 3600  # Re-verify mappings after 30 days
+    SHORT_LINK_REFRESH_INTERVAL = 6 * 3600
+    SHORT_LINK_REFRESH_BATCH = 100
+    SHORT_LINK_RETRY_DELAY = 24 * 3600  # Wait before re-verifying a link that failed to resolve
+    SHORT_LINK_RESOLVE_WORKERS = 4
+    
+    # Scraping pipeline
+    SWEEP_WORKERS = int(os.getenv('SWEEP_WORKERS', 8))  # Concurrent fetches during a sweep
+    SWEEP_HEARTBEAT_INTERVAL = 30  # Seconds between a running sweep's ownership refreshes
+    SWEEP_HEARTBEAT_TIMEOUT = 300  # Another process may take over a sweep this long without a heartbeat
+    SITE_CONCURRENCY = {'amazon': 4, 'flipkart': 2}  # Max in-flight requests per site
+    PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', os.cpu_count() or 1))  # 0 parses in-process
+    PARSE_QUEUE_SIZE = PARSE_WORKERS * 2  # Fetched pages waiting for a parse worker
\ No newline at end of file
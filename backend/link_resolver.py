@@ -0,0 +1,150 @@
+"""Resolve amzn.in / dl.flipkart.com short links once and remember where they lead.
+
+Resolutions are stored in the short_links table with a long TTL. Fetches use
+the stored product URL directly; stale mappings are only re-verified by the
+background refresh job, never on the request path.
+"""
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs, urlencode
+
+import requests
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SHORT_LINK_DOMAINS = ('amzn.in', 'amzn.to', 'dl.flipkart.com', 'fkrt.it')
+
+
+def is_short_link(url):
+    domain = urlparse(url).netloc.lower()
+    return any(domain == d or domain.endswith('.' + d) for d in SHORT_LINK_DOMAINS)
+
+
+def canonical_url(url):
+    """Strip tracking parameters so equivalent product URLs compare equal"""
+    parsed = urlparse(url)
+    domain = parsed.netloc.lower()
+
+    if 'amazon.' in domain:
+        match = re.search(r'/(?:dp|gp/product)/([A-Z0-9]{10})', parsed.path, re.IGNORECASE)
+        if match:
+            return f'https://{domain}/dp/{match.group(1).upper()}'
+    elif 'flipkart.com' in domain:
+        pid = parse_qs(parsed.query).get('pid')
+        query = f'?{urlencode({"pid": pid[0]})}' if pid else ''
+        return f'https://{domain}{parsed.path}{query}'
+
+    return parsed._replace(fragment='').geturl()
+
+
+class ShortLinkResolver:
+    def __init__(self, db, headers=None):
+        self.db = db
+        self.headers = headers or {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        }
+        self.lock = threading.Lock()
+        self.cache = {}  # short url -> resolved url
+
+    def resolve(self, url):
+        """Return the product URL a short link points at (or the URL itself)"""
+        return self.resolve_many([url])[url]
+
+    def resolve_many(self, urls):
+        """Resolve a batch of URLs with one cache query and concurrent lookups for misses"""
+        resolved = {url: url for url in urls}
+        short = [url for url in set(urls) if is_short_link(url)]
+
+        with self.lock:
+            missing = [url for url in short if url not in self.cache]
+            for url in short:
+                if url in self.cache:
+                    resolved[url] = self.cache[url]
+
+        if missing:
+            found = {}
+            # Chunked to stay under SQLite's bound-parameter limit
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ', '.join(['?'] * len(chunk))
+                rows = self.db.fetchall(
+                    f'SELECT short_url, resolved_url FROM short_links WHERE short_url IN ({placeholders})',
+                    chunk
+                )
+                found.update({row['short_url']: row['resolved_url'] for row in rows})
+            to_fetch = [url for url in missing if url not in found]
+
+            if to_fetch:
+                workers = min(len(to_fetch), Config.SHORT_LINK_RESOLVE_WORKERS)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for url, target in zip(to_fetch, pool.map(self.follow, to_fetch)):
+                        if target:
+                            self.store(url, target)
+                            found[url] = target
+
+            with self.lock:
+                self.cache.update(found)
+            resolved.update(found)
+
+        return resolved
+
+    def follow(self, url):
+        """Follow a short link's redirect chain; returns None on failure"""
+        try:
+            response = requests.head(url, headers=self.headers, allow_redirects=True, timeout=10)
+            if response.status_code >= 400:
+                # Some sites reject HEAD; fall back to a GET without reading the body
+                response = requests.get(url, headers=self.headers, allow_redirects=True, timeout=10, stream=True)
+                response.close()
+            if is_short_link(response.url):
+                return None
+            return response.url
+        except requests.RequestException as e:
+            logger.warning(f"Failed to resolve short link {url}: {str(e)}")
+            return None
+
+    def store(self, short_url, resolved_url):
+        now = datetime.now()
+        self.db.execute(
+            '''INSERT INTO short_links (short_url, resolved_url, canonical_url, resolved_at, verified_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (short_url) DO UPDATE SET
+                   resolved_url = excluded.resolved_url,
+                   canonical_url = excluded.canonical_url,
+                   verified_at = excluded.verified_at''',
+            (short_url, resolved_url, canonical_url(resolved_url), now, now)
+        )
+
+    def refresh_stale(self):
+        """Re-verify mappings older than SHORT_LINK_TTL (run from the scheduler)"""
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=Config.SHORT_LINK_TTL)
+        rows = self.db.fetchall(
+            '''SELECT short_url, resolved_url FROM short_links WHERE verified_at < ?
+               ORDER BY verified_at LIMIT ?''',
+            (cutoff, Config.SHORT_LINK_REFRESH_BATCH)
+        )
+        refreshed = 0
+        for row in rows:
+            target = self.follow(row['short_url'])
+            if not target:
+                # Keep the old mapping but retry later, so dead links can't
+                # hold the front of the queue
+                retry_at = cutoff + timedelta(seconds=Config.SHORT_LINK_RETRY_DELAY)
+                self.db.execute(
+                    'UPDATE short_links SET verified_at = ? WHERE short_url = ?',
+                    (retry_at, row['short_url'])
+                )
+                continue
+            self.store(row['short_url'], target)
+            with self.lock:
+                self.cache[row['short_url']] = target
+            refreshed += 1
+
+        logger.info(f"Re-verified {refreshed}/{len(rows)} stale short links")
+        return refreshed
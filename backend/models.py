@@ -1,70 +1,55 @@
-import sqlite3
 from config import Config
+from storage import create_backend
+from price_index import target_index
+from response_cache import product_list_cache
+from link_resolver import is_short_link
 import bcrypt
 from datetime import datetime
 
 class Database:
     def __init__(self):
-        # Extract just the database name from DATABASE_URL
-        db_path = Config.DATABASE_URL.replace('sqlite:///', '')
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        # Driver is picked from the scheme of DATABASE_URL (sqlite:///, postgresql://)
+        self.backend = create_backend(
+            Config.DATABASE_URL,
+            pool_min_size=Config.DB_POOL_MIN_SIZE,
+            pool_max_size=Config.DB_POOL_MAX_SIZE
+        )
+        self.IntegrityError = self.backend.IntegrityError
         self.create_tables()
     
     def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Products table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                url TEXT NOT NULL,
-                site_source TEXT,
-                product_title TEXT,
-                current_price REAL,
-                target_price REAL NOT NULL,
-                last_checked TIMESTAMP,
-                is_active INTEGER DEFAULT 1,
-                alert_sent INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
-        
-        self.conn.commit()
+        self.backend.create_tables()
+    
+    def transaction(self):
+        return self.backend.transaction()
     
-    def get_cursor(self):
-        return self.conn.cursor()
+    def fetchone(self, query, params=()):
+        return self.backend.fetchone(query, params)
+    
+    def fetchall(self, query, params=()):
+        return self.backend.fetchall(query, params)
+    
+    def execute(self, query, params=()):
+        return self.backend.execute(query, params)
+    
+    def insert(self, query, params=()):
+        return self.backend.insert(query, params)
+    
+    def update_prices(self, rows):
+        return self.backend.update_prices(rows)
 
 class User:
     @staticmethod
     def create(db, email, password):
         password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        cursor = db.get_cursor()
-        cursor.execute(
+        return db.insert(
             'INSERT INTO users (email, password_hash) VALUES (?, ?)',
             (email, password_hash.decode('utf-8'))
         )
-        db.conn.commit()
-        return cursor.lastrowid
     
     @staticmethod
     def find_by_email(db, email):
-        cursor = db.get_cursor()
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        return db.fetchone('SELECT * FROM users WHERE email = ?', (email,))
     
     @staticmethod
     def verify_password(stored_hash, password):
@@ -73,63 +58,268 @@ class User:
 class Product:
     @staticmethod
     def create(db, user_id, url, target_price, site_source, product_title, current_price):
-        cursor = db.get_cursor()
-        cursor.execute(
+        product_id = db.insert(
             '''INSERT INTO products 
                (user_id, url, target_price, site_source, product_title, current_price, last_checked)
                VALUES (?, ?, ?, ?, ?, ?, ?)''',
             (user_id, url, target_price, site_source, product_title, current_price, datetime.now())
         )
-        db.conn.commit()
-        return cursor.lastrowid
+        Product.bump_list_version(db, user_ids=[user_id])
+        target_index.add(product_id, Product.item_urls(db, [url])[url], target_price)
+        product_list_cache.invalidate_user(user_id)
+        return product_id
     
     @staticmethod
-    def get_user_products(db, user_id):
-        cursor = db.get_cursor()
-        cursor.execute(
-            'SELECT * FROM products WHERE user_id = ? AND is_active = 1',
-            (user_id,)
-        )
-        return [dict(row) for row in cursor.fetchall()]
+    def create_many(db, user_id, products, max_products=None):
+        """Insert several products in one transaction and return their ids
+        
+        With max_products, only as many as still fit under the user's limit
+        are inserted (the leading ones), so fewer ids may come back.
+        """
+        now = datetime.now()
+        with db.transaction() as tx:
+            # Bumping first takes the user's version row lock, so concurrent
+            # imports for one user count and insert one after the other
+            Product.bump_list_version(tx, user_ids=[user_id])
+            if max_products is not None:
+                count = tx.fetchone(
+                    'SELECT COUNT(*) as count FROM products WHERE user_id = ? AND is_active = 1',
+                    (user_id,)
+                )['count']
+                products = products[:max(0, max_products - count)]
+            product_ids = [
+                tx.insert(
+                    '''INSERT INTO products 
+                       (user_id, url, target_price, site_source, product_title, current_price, last_checked)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (user_id, p['url'], p['target_price'], p['site_source'],
+                     p['product_title'], p['current_price'], now)
+                )
+                for p in products
+            ]
+        item_urls = Product.item_urls(db, [p['url'] for p in products])
+        for product_id, p in zip(product_ids, products):
+            target_index.add(product_id, item_urls[p['url']], p['target_price'])
+        product_list_cache.invalidate_user(user_id)
+        return product_ids
+    
+    @staticmethod
+    def list_version(db, user_id):
+        """Version of the user's product list, bumped by every write to it"""
+        row = db.fetchone('SELECT version FROM product_list_versions WHERE user_id = ?', (user_id,))
+        return row['version'] if row else 0
+    
+    @staticmethod
+    def bump_list_version(db, user_ids=(), product_ids=()):
+        """Mark product lists as changed, by owner or by product
+        
+        `db` may also be an open transaction. Runs after the data write, so a
+        reader that sees the new version also sees the new rows.
+        """
+        upsert = ''' ON CONFLICT (user_id) DO UPDATE
+                     SET version = product_list_versions.version + 1'''
+        for user_id in set(user_ids):
+            db.execute(
+                'INSERT INTO product_list_versions (user_id, version) VALUES (?, 1)' + upsert,
+                (user_id,)
+            )
+        product_ids = list(product_ids)
+        # Chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(product_ids), 500):
+            chunk = product_ids[i:i + 500]
+            placeholders = ', '.join(['?'] * len(chunk))
+            db.execute(
+                f'''INSERT INTO product_list_versions (user_id, version)
+                    SELECT DISTINCT user_id, 1 FROM products WHERE id IN ({placeholders})''' + upsert,
+                chunk
+            )
+    
+    @staticmethod
+    def item_urls(db, urls):
+        """Map each URL to the canonical product URL it names
+        
+        Short links resolve through the short_links table; anything not yet
+        resolved, and every full URL, maps to itself.
+        """
+        mapping = {url: url for url in urls}
+        short = list({url for url in urls if is_short_link(url)})
+        # Chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(short), 500):
+            chunk = short[i:i + 500]
+            placeholders = ', '.join(['?'] * len(chunk))
+            rows = db.fetchall(
+                f'SELECT short_url, canonical_url FROM short_links WHERE short_url IN ({placeholders})',
+                chunk
+            )
+            mapping.update({row['short_url']: row['canonical_url'] for row in rows})
+        return mapping
+    
+    @staticmethod
+    def get_user_products(db, user_id, after_id=None, limit=None):
+        """Active products in id order; after_id/limit give cursor pagination"""
+        query = 'SELECT * FROM products WHERE user_id = ? AND is_active = 1'
+        params = [user_id]
+        if after_id is not None:
+            query += ' AND id > ?'
+            params.append(after_id)
+        query += ' ORDER BY id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return db.fetchall(query, params)
+    
+    @staticmethod
+    def get_by_ids(db, product_ids):
+        """Active products with the given ids"""
+        product_ids = list(product_ids)
+        rows = []
+        # Chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(product_ids), 500):
+            chunk = product_ids[i:i + 500]
+            placeholders = ', '.join(['?'] * len(chunk))
+            rows.extend(db.fetchall(
+                f'SELECT * FROM products WHERE is_active = 1 AND id IN ({placeholders})',
+                chunk
+            ))
+        return rows
     
     @staticmethod
     def count_user_products(db, user_id):
-        cursor = db.get_cursor()
-        cursor.execute(
+        return db.fetchone(
             'SELECT COUNT(*) as count FROM products WHERE user_id = ? AND is_active = 1',
             (user_id,)
-        )
-        return cursor.fetchone()['count']
+        )['count']
     
     @staticmethod
     def delete(db, product_id, user_id):
-        cursor = db.get_cursor()
-        cursor.execute(
+        if db.execute(
             'UPDATE products SET is_active = 0 WHERE id = ? AND user_id = ?',
             (product_id, user_id)
-        )
-        db.conn.commit()
+        ):
+            target_index.remove(product_id)
+            Product.bump_list_version(db, user_ids=[user_id])
+        product_list_cache.invalidate_user(user_id)
     
     @staticmethod
     def update_price(db, product_id, new_price):
-        cursor = db.get_cursor()
-        cursor.execute(
+        db.execute(
             'UPDATE products SET current_price = ?, last_checked = ? WHERE id = ?',
             (new_price, datetime.now(), product_id)
         )
-        db.conn.commit()
+        Product.bump_list_version(db, product_ids=[product_id])
+    
+    @staticmethod
+    def update_prices(db, prices):
+        """Bulk write-back of {product_id: new_price} in one round-trip"""
+        now = datetime.now()
+        db.update_prices([(product_id, price, now) for product_id, price in prices.items()])
+        Product.bump_list_version(db, product_ids=list(prices))
     
     @staticmethod
     def mark_alert_sent(db, product_id):
-        cursor = db.get_cursor()
-        cursor.execute(
+        db.execute(
             'UPDATE products SET alert_sent = 1 WHERE id = ?',
             (product_id,)
         )
-        db.conn.commit()
+        target_index.remove(product_id)
+        Product.bump_list_version(db, product_ids=[product_id])
+    
+    @staticmethod
+    def get_alertable(db, price):
+        """Active, un-alerted products whose target is at or above `price`"""
+        return db.fetchall(
+            'SELECT * FROM products WHERE is_active = 1 AND alert_sent = 0 AND target_price >= ?',
+            (price,)
+        )
     
     @staticmethod
     def get_all_active(db):
-        cursor = db.get_cursor()
-        cursor.execute('SELECT * FROM products WHERE is_active = 1')
-        return [dict(row) for row in cursor.fetchall()]
\ No newline at end of file
+        return db.fetchall('SELECT * FROM products WHERE is_active = 1')
+    
+    @staticmethod
+    def get_due_for_check(db, checked_before=None):
+        """Active products, least recently checked first (never-checked ones lead)"""
+        query = 'SELECT * FROM products WHERE is_active = 1'
+        params = ()
+        if checked_before is not None:
+            query += ' AND (last_checked IS NULL OR last_checked < ?)'
+            params = (checked_before,)
+        return db.fetchall(query + ' ORDER BY (last_checked IS NOT NULL), last_checked, id', params)
+    
+    @staticmethod
+    def due_order(product):
+        """Sort key matching get_due_for_check's ORDER BY"""
+        if product['last_checked'] is None:
+            return (0, product['id'])
+        return (1, product['last_checked'], product['id'])
+
+class Sweep:
+    """Progress of a price-check sweep, shared by every process running the scheduler
+    
+    A sweep is owned by whichever process last claimed it. The owner keeps
+    heartbeat_at fresh; writes from a process that lost ownership are ignored.
+    """
+    @staticmethod
+    def start(db, owner, started_at):
+        """Open a sweep owned by `owner`, or return None if one is already unfinished"""
+        try:
+            return db.insert(
+                'INSERT INTO sweeps (started_at, owner, heartbeat_at, running) VALUES (?, ?, ?, 1)',
+                (started_at, owner, started_at)
+            )
+        except db.IntegrityError:
+            return None
+    
+    @staticmethod
+    def find_unfinished(db, stale_before=None):
+        """The unfinished sweep; with stale_before, only if no live process owns it"""
+        query = 'SELECT * FROM sweeps WHERE finished_at IS NULL'
+        params = ()
+        if stale_before is not None:
+            query += ' AND (owner IS NULL OR heartbeat_at < ?)'
+            params = (stale_before,)
+        return db.fetchone(query + ' ORDER BY id DESC LIMIT 1', params)
+    
+    @staticmethod
+    def claim(db, sweep_id, owner, stale_before):
+        """Take over an unfinished sweep whose owner stopped heartbeating"""
+        return db.execute(
+            '''UPDATE sweeps SET owner = ?, heartbeat_at = ?
+               WHERE id = ? AND finished_at IS NULL
+               AND (owner IS NULL OR owner = ? OR heartbeat_at < ?)''',
+            (owner, datetime.now(), sweep_id, owner, stale_before)
+        ) == 1
+    
+    @staticmethod
+    def heartbeat(db, sweep_id, owner):
+        """Refresh ownership; False means another process has claimed the sweep"""
+        return db.execute(
+            'UPDATE sweeps SET heartbeat_at = ? WHERE id = ? AND owner = ? AND finished_at IS NULL',
+            (datetime.now(), sweep_id, owner)
+        ) == 1
+    
+    @staticmethod
+    def checkpoint(db, sweep_id, owner, last_product, products_checked):
+        """Record progress; every item due before last_product has been checked"""
+        if last_product is None:
+            db.execute(
+                '''UPDATE sweeps SET products_checked = products_checked + ?, heartbeat_at = ?
+                   WHERE id = ? AND owner = ?''',
+                (products_checked, datetime.now(), sweep_id, owner)
+            )
+            return
+        db.execute(
+            '''UPDATE sweeps SET last_product_id = ?, last_product_checked = ?,
+               products_checked = products_checked + ?, heartbeat_at = ?
+               WHERE id = ? AND owner = ?''',
+            (last_product['id'], last_product['last_checked'], products_checked,
+             datetime.now(), sweep_id, owner)
+        )
+    
+    @staticmethod
+    def finish(db, sweep_id, owner, overrun_seconds):
+        return db.execute(
+            '''UPDATE sweeps SET finished_at = ?, overrun_seconds = ?, running = NULL
+               WHERE id = ? AND owner = ?''',
+            (datetime.now(), overrun_seconds, sweep_id, owner)
+        ) == 1
@@ -0,0 +1,154 @@
+"""In-memory index of un-alerted watchers per tracked item, sorted by target price.
+
+For each item the index keeps two parallel arrays (target prices and product
+ids) ordered by target price, so a new price yields every watcher whose
+target is at or above it with a single binary search.
+"""
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from urllib.parse import urlparse, parse_qs
+
+from config import Config
+
+
+def product_code(url):
+    """The site's own product id in a URL (Amazon ASIN or Flipkart pid), if present"""
+    parsed = urlparse(url)
+    domain = parsed.netloc.lower()
+
+    if 'amazon.' in domain:
+        match = re.search(r'/(?:dp|gp/product)/([A-Z0-9]{10})', parsed.path, re.IGNORECASE)
+        if match:
+            return match.group(1).upper()
+    elif 'flipkart.com' in domain:
+        pid = parse_qs(parsed.query).get('pid')
+        if pid:
+            return pid[0].upper()
+    return None
+
+
+def item_key(url):
+    """Identify the item a product URL points at, so watchers of the same item share a key
+
+    Keys keep the normalised domain, so the same ASIN on amazon.in and
+    amazon.com (different stores and currencies) stay separate items.
+    """
+    parsed = urlparse(url)
+    domain = parsed.netloc.lower()
+    if domain.startswith('www.'):
+        domain = domain[4:]
+
+    code = product_code(url)
+    if code:
+        return f'{domain}:{code}'
+    if 'flipkart.com' in domain:
+        match = re.search(r'/p/(itm[0-9a-z]+)', parsed.path, re.IGNORECASE)
+        if match:
+            return f'{domain}:{match.group(1).lower()}'
+
+    return f'{domain}{parsed.path.rstrip("/")}'
+
+
+class TargetPriceIndex:
+    def __init__(self, max_watchers=None):
+        self.max_watchers = max_watchers or Config.TARGET_INDEX_MAX_WATCHERS
+        self.lock = threading.Lock()
+        self.items = {}         # item key -> (targets array, product ids array)
+        self.locations = {}     # product id -> item key
+        self.overflow = set()   # item keys not indexed because of the memory cap
+        self.loaded = False
+
+    def rebuild(self, db):
+        """Load every active, un-alerted watcher from the database
+
+        Short links are keyed by the product page they were resolved to, so
+        they share an item with watchers who pasted the full URL.
+        """
+        rows = db.fetchall(
+            '''SELECT p.id, COALESCE(s.canonical_url, p.url) AS url, p.target_price
+               FROM products p LEFT JOIN short_links s ON s.short_url = p.url
+               WHERE p.is_active = 1 AND p.alert_sent = 0
+               ORDER BY p.target_price'''
+        )
+
+        items = {}
+        locations = {}
+        overflow = set()
+        for row in rows:
+            key = item_key(row['url'])
+            if key in overflow:
+                continue
+            if len(locations) >= self.max_watchers:
+                # Drop the whole item so lookups fall back to scanning its rows
+                overflow.add(key)
+                if key in items:
+                    for product_id in items.pop(key)[1]:
+                        del locations[product_id]
+                continue
+            targets, ids = items.setdefault(key, (array('d'), array('q')))
+            # Rows arrive ordered by target price, so appending keeps arrays sorted
+            targets.append(float(row['target_price']))
+            ids.append(row['id'])
+            locations[row['id']] = key
+
+        with self.lock:
+            self.items = items
+            self.locations = locations
+            self.overflow = overflow
+            self.loaded = True
+
+    def add(self, product_id, url, target_price):
+        """Index a new watcher"""
+        key = item_key(url)
+        with self.lock:
+            if not self.loaded or key in self.overflow:
+                return
+            if len(self.locations) >= self.max_watchers:
+                self._drop_item(key)
+                return
+
+            targets, ids = self.items.setdefault(key, (array('d'), array('q')))
+            position = bisect_right(targets, float(target_price))
+            targets.insert(position, float(target_price))
+            ids.insert(position, product_id)
+            self.locations[product_id] = key
+
+    def remove(self, product_id):
+        """Stop tracking a watcher (deleted, or already alerted)"""
+        with self.lock:
+            key = self.locations.pop(product_id, None)
+            if key is None:
+                return
+            targets, ids = self.items[key]
+            position = ids.index(product_id)
+            del targets[position]
+            del ids[position]
+            if not ids:
+                del self.items[key]
+
+    def triggered(self, key, price):
+        """Product ids watching `key` whose target is at or above `price`
+
+        Returns None when the item is not indexed and callers must scan rows instead.
+        """
+        with self.lock:
+            if not self.loaded or key in self.overflow:
+                return None
+            if key not in self.items:
+                return []
+            targets, ids = self.items[key]
+            return ids[bisect_left(targets, float(price)):].tolist()
+
+    def _drop_item(self, key):
+        self.overflow.add(key)
+        for product_id in self.items.pop(key, (None, ()))[1]:
+            del self.locations[product_id]
+
+    def __len__(self):
+        return len(self.locations)
+
+
+# Shared by the API and the scheduler so writes from either keep it in sync
+target_index = TargetPriceIndex()
@@ -0,0 +1,75 @@
+"""Per-user cache of rendered GET /api/products responses.
+
+Entries are tagged with the user's product-list version from the database
+(Product.list_version), which every Product write bumps. A request only
+reuses an entry whose version still matches, so writes made by any process
+(API workers, the scheduler, the reloader's parent) are seen on the next
+request. Each entry keeps the serialized body, its strong ETag and a lazily
+built gzip copy.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import Config
+
+
+class ProductListCache:
+    def __init__(self, max_users=None, max_pages=None):
+        self.max_users = max_users or Config.PRODUCT_CACHE_MAX_USERS
+        self.max_pages = max_pages or Config.PRODUCT_CACHE_MAX_PAGES
+        self.lock = threading.Lock()
+        # user id -> {'version': v, 'pages': OrderedDict((cursor, limit) -> entry)},
+        # least recently used first at both levels
+        self.entries = OrderedDict()
+
+    def get(self, user_id, key, version):
+        """Cached entry for a page, if it was rendered at `version`"""
+        with self.lock:
+            user = self.entries.get(user_id)
+            if user is None or user['version'] != version or key not in user['pages']:
+                return None
+            self.entries.move_to_end(user_id)
+            user['pages'].move_to_end(key)
+            return user['pages'][key]
+
+    def put(self, user_id, key, body, version):
+        """Cache a body rendered from data read at `version` (taken before the read)"""
+        entry = {
+            'body': body,
+            'etag': hashlib.sha256(body).hexdigest()[:32],  # Unquoted, as werkzeug expects
+            'gzip': None
+        }
+        with self.lock:
+            user = self.entries.get(user_id)
+            if user is None or user['version'] != version:
+                user = self.entries[user_id] = {'version': version, 'pages': OrderedDict()}
+            user['pages'][key] = entry
+            user['pages'].move_to_end(key)
+            self.entries.move_to_end(user_id)
+            # Cursors come from the client, so pages per user are bounded too
+            while len(user['pages']) > self.max_pages:
+                user['pages'].popitem(last=False)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+        return entry
+
+    def gzipped(self, entry):
+        """Compressed body, built once per entry"""
+        if entry['gzip'] is None:
+            entry['gzip'] = gzip.compress(entry['body'], compresslevel=6)
+        return entry['gzip']
+
+    def invalidate_user(self, user_id):
+        """Free a user's pages early; correctness comes from the version check"""
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(user['pages']) for user in self.entries.values())
+
+
+# Shared by the API and the scheduler in one process
+product_list_cache = ProductListCache()
@@ -1,94 +1,320 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from models import Database, Product, User
+from models import Database, Product, Sweep, User
 from scraper import PriceScraper
 from email_service import EmailService
 from config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from price_index import item_key, target_index
+from link_resolver import ShortLinkResolver
+import structured_data
+from datetime import datetime, timedelta
 import logging
+import os
+import socket
+import threading
+import time
+import uuid
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def as_datetime(value):
+    """SQLite hands timestamps back as ISO strings, PostgreSQL as datetimes"""
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
 class PriceChecker:
     def __init__(self):
         self.db = Database()
-        self.scraper = PriceScraper()
+        self.resolver = ShortLinkResolver(self.db)
+        self.scraper = PriceScraper(resolver=self.resolver)
         self.email_service = EmailService()
         self.scheduler = BackgroundScheduler()
+        self.sweep_lock = threading.Lock()
+        # Identifies this process in the sweeps table
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        
+        # Load watchers sorted by target price for alert fan-out
+        target_index.rebuild(self.db)
+        logger.info(f"Target price index loaded with {len(target_index)} watchers")
     
     def check_all_prices(self):
-        """Check prices for all active products"""
-        logger.info("Starting price check for all products...")
+        """Check prices for all active products, resuming an interrupted sweep if there is one"""
+        # Refuse to overlap with a sweep that is still running in this process;
+        # other processes are kept out by the sweep row's owner
+        if not self.sweep_lock.acquire(blocking=False):
+            logger.warning("Previous price check is still running - skipping this run")
+            return
         
         try:
-            products = Product.get_all_active(self.db)
-            
-            for product in products:
-                self.check_single_product(product)
-            
-            logger.info(f"Completed price check for {len(products)} products")
+            self.run_sweep()
         except Exception as e:
             logger.error(f"Error in price check: {str(e)}")
+        finally:
+            self.sweep_lock.release()
+    
+    def run_sweep(self):
+        """Check every product due in this sweep, least recently checked first"""
+        started = time.monotonic()
+        now = datetime.now()
+        stale_before = now - timedelta(seconds=Config.SWEEP_HEARTBEAT_TIMEOUT)
+        sweep = Sweep.find_unfinished(self.db)
+        
+        if sweep:
+            sweep_id = sweep['id']
+            if not Sweep.claim(self.db, sweep_id, self.owner, stale_before):
+                logger.warning(f"Sweep {sweep_id} is running in another process - skipping this run")
+                return
+            sweep_started = as_datetime(sweep['started_at'])
+            
+            # Only products not yet written back since the interrupted sweep began,
+            # after the last checkpoint (earlier ones left are failed scrapes)
+            products = Product.get_due_for_check(self.db, checked_before=sweep['started_at'])
+            if sweep['last_product_id'] is not None:
+                resume_after = Product.due_order({
+                    'id': sweep['last_product_id'],
+                    'last_checked': sweep['last_product_checked']
+                })
+                products = [p for p in products if Product.due_order(p) > resume_after]
+            logger.info(
+                f"Resuming sweep {sweep_id} after product {sweep['last_product_id']} "
+                f"({len(products)} products left)"
+            )
+        else:
+            sweep_started = now
+            sweep_id = Sweep.start(self.db, self.owner, sweep_started)
+            if sweep_id is None:
+                logger.warning("Another process has just started a sweep - skipping this run")
+                return
+            products = Product.get_due_for_check(self.db)
+            logger.info(f"Starting sweep {sweep_id} for {len(products)} products...")
+        
+        # Keep the claim alive while fetches run; stop early if it is taken over
+        stop_heartbeat = threading.Event()
+        lost = threading.Event()
+        threading.Thread(
+            target=self.keep_sweep_alive,
+            args=(sweep_id, stop_heartbeat, lost),
+            daemon=True
+        ).start()
+        
+        try:
+            self.check_sweep_products(sweep_id, products, lost)
+        finally:
+            stop_heartbeat.set()
+        
+        if lost.is_set():
+            logger.warning(f"Sweep {sweep_id} was taken over by another process - stopping")
+            return
+        
+        # Overrun covers the whole sweep, including runs before an interruption
+        elapsed = (datetime.now() - sweep_started).total_seconds()
+        overrun = max(0.0, elapsed - Config.PRICE_CHECK_INTERVAL)
+        Sweep.finish(self.db, sweep_id, self.owner, overrun)
+        
+        if overrun:
+            logger.warning(
+                f"Sweep {sweep_id} took {elapsed:.0f}s, overrunning the "
+                f"{Config.PRICE_CHECK_INTERVAL}s interval by {overrun:.0f}s"
+            )
+        logger.info(
+            f"Completed sweep {sweep_id}: {len(products)} products in "
+            f"{time.monotonic() - started:.1f}s ({elapsed:.1f}s since it started)"
+        )
+        for site, stats in structured_data.extraction_stats.snapshot().items():
+            logger.info(f"Extraction hit rates for {site}: {stats['hit_rates']}")
+    
+    def check_sweep_products(self, sweep_id, products, lost):
+        """Scrape each item once and write prices and checkpoints back in batches"""
+        # Resolve any short links for the whole sweep in one batch
+        resolved = self.resolver.resolve_many([p['url'] for p in products])
+        
+        # Products watching the same item share one scrape, whether they were
+        # added by short link or full URL; dicts keep the due order
+        items = {}
+        for product in products:
+            items.setdefault(item_key(resolved[product['url']]), []).append(product)
+        first_due = [watchers[0] for watchers in items.values()]
+        
+        pending_prices = {}
+        done = set()
+        # Every item before progress['next'] has been checked; the first-due
+        # product of the last one is the resume point
+        progress = {'next': 0, 'last_product': None}
+        
+        def flush():
+            Product.update_prices(self.db, pending_prices)
+            Sweep.checkpoint(self.db, sweep_id, self.owner, progress['last_product'], len(pending_prices))
+            pending_prices.clear()
+        
+        # Fetch items concurrently; per-site limits and the parse pool live in the scraper
+        with ThreadPoolExecutor(max_workers=Config.SWEEP_WORKERS) as pool:
+            futures = {
+                pool.submit(self.check_item, key, watchers, {}): position
+                for position, (key, watchers) in enumerate(items.items())
+            }
+            for future in as_completed(futures):
+                pending_prices.update(future.result() or {})
+                done.add(futures[future])
+                while progress['next'] in done:
+                    progress['last_product'] = first_due[progress['next']]
+                    progress['next'] += 1
+                
+                if lost.is_set():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    break
+                
+                # Write prices back in batches instead of one commit per product
+                if len(pending_prices) >= Config.PRICE_WRITE_BATCH_SIZE:
+                    flush()
+        
+        if pending_prices:
+            flush()
+    
+    def keep_sweep_alive(self, sweep_id, stop, lost):
+        """Heartbeat the sweep row until stopped or until ownership is lost"""
+        while not stop.wait(Config.SWEEP_HEARTBEAT_INTERVAL):
+            try:
+                if not Sweep.heartbeat(self.db, sweep_id, self.owner):
+                    lost.set()
+                    return
+            except Exception as e:
+                logger.error(f"Error refreshing sweep {sweep_id}: {str(e)}")
     
-    def check_single_product(self, product):
+    def check_single_product(self, product, pending_prices=None):
         """Check price for a single product and send alert if needed"""
+        self.check_item(item_key(self.resolver.resolve(product['url'])), [product], pending_prices)
+    
+    def check_item(self, key, watchers, pending_prices=None):
+        """Scrape one item and alert every watcher whose target it has reached
+        
+        If pending_prices is given, new prices are queued there for a bulk
+        write-back instead of being written immediately, and it is returned.
+        """
         try:
-            logger.info(f"Checking price for product ID: {product['id']}")
+            logger.info(f"Checking price for item {key} ({len(watchers)} watchers)")
             
             # Scrape current price
-            result = self.scraper.scrape(product['url'])
+            result = self.scraper.scrape(watchers[0]['url'])
             
             if not result['success']:
-                logger.warning(f"Failed to scrape product {product['id']}: {result.get('error')}")
+                logger.warning(f"Failed to scrape item {key}: {result.get('error')}")
                 return
             
             current_price = result['price']
             
             # Update price in database
-            Product.update_price(self.db, product['id'], current_price)
-            logger.info(f"Updated price for product {product['id']}: ₹{current_price}")
+            for product in watchers:
+                if pending_prices is None:
+                    Product.update_price(self.db, product['id'], current_price)
+                else:
+                    pending_prices[product['id']] = current_price
+            logger.info(f"Updated price for item {key}: ₹{current_price}")
             
-            # Check if price dropped below target
-            if current_price <= product['target_price'] and not product['alert_sent']:
-                logger.info(f"Price alert triggered for product {product['id']}")
-                
-                # Get user email
-                user = User.find_by_email(self.db, self.get_user_email(product['user_id']))
-                
-                if user:
-                    # Send email alert
-                    success = self.email_service.send_price_alert(
-                        to_email=user['email'],
-                        product_title=product['product_title'],
-                        current_price=current_price,
-                        target_price=product['target_price'],
-                        product_url=product['url']
-                    )
-                    
-                    if success:
-                        # Mark alert as sent
-                        Product.mark_alert_sent(self.db, product['id'])
-                        logger.info(f"Alert sent successfully for product {product['id']}")
-                    else:
-                        logger.error(f"Failed to send email for product {product['id']}")
+            # The rows we hold are authoritative; the in-memory index may miss
+            # products written by other processes
+            triggered = [
+                p for p in watchers
+                if current_price <= p['target_price'] and not p['alert_sent']
+            ]
+            
+            for product in triggered:
+                self.send_alert(product, current_price)
         
         except Exception as e:
-            logger.error(f"Error checking product {product['id']}: {str(e)}")
+            logger.error(f"Error checking item {key}: {str(e)}")
+        
+        return pending_prices
+    
+    def schedule_fan_out(self, url, current_price, exclude_ids=()):
+        """Alert other watchers of a freshly scraped item, off the request path"""
+        self.scheduler.add_job(
+            self.fan_out,
+            args=[url, current_price, set(exclude_ids)],
+            misfire_grace_time=None
+        )
+    
+    def fan_out(self, url, current_price, exclude_ids=()):
+        """Alert watchers of the item at `url` whose target the new price has reached
+        
+        Used when a price is learned outside a sweep, so no rows are at hand:
+        the target price index narrows the candidates and their rows are
+        re-read before anyone is alerted. Items the index dropped for its
+        memory cap are scanned in the database instead.
+        """
+        try:
+            key = item_key(self.resolver.resolve(url))
+            candidate_ids = target_index.triggered(key, current_price)
+            if candidate_ids is None:
+                rows = Product.get_alertable(self.db, current_price)
+            elif candidate_ids:
+                rows = Product.get_by_ids(self.db, candidate_ids)
+            else:
+                return
+            
+            rows = [p for p in rows if p['id'] not in exclude_ids]
+            item_urls = Product.item_urls(self.db, [p['url'] for p in rows])
+            for product in rows:
+                if item_key(item_urls[product['url']]) != key:
+                    continue
+                if current_price <= product['target_price'] and not product['alert_sent']:
+                    self.send_alert(product, current_price)
+        
+        except Exception as e:
+            logger.error(f"Error fanning out price for {url}: {str(e)}")
+    
+    def send_alert(self, product, current_price):
+        """Email the product's owner and mark the alert as sent"""
+        logger.info(f"Price alert triggered for product {product['id']}")
+        
+        # Get user email
+        user = User.find_by_email(self.db, self.get_user_email(product['user_id']))
+        
+        if user:
+            # Send email alert
+            success = self.email_service.send_price_alert(
+                to_email=user['email'],
+                product_title=product['product_title'],
+                current_price=current_price,
+                target_price=product['target_price'],
+                product_url=product['url']
+            )
+            
+            if success:
+                # Mark alert as sent
+                Product.mark_alert_sent(self.db, product['id'])
+                logger.info(f"Alert sent successfully for product {product['id']}")
+            else:
+                logger.error(f"Failed to send email for product {product['id']}")
     
     def get_user_email(self, user_id):
         """Get user email by user_id"""
-        cur = self.db.get_cursor()
-        cur.execute('SELECT email FROM users WHERE id = ?', (user_id,))
-        result = cur.fetchone()
-        return dict(result)['email'] if result else None
+        result = self.db.fetchone('SELECT email FROM users WHERE id = ?', (user_id,))
+        return result['email'] if result else None
     
     def start(self):
         """Start the background scheduler"""
-        # Schedule price checks every hour
+        # Schedule price checks every hour; never run two sweeps at once
+        job_options = {'max_instances': 1, 'coalesce': True}
+        stale_before = datetime.now() - timedelta(seconds=Config.SWEEP_HEARTBEAT_TIMEOUT)
+        if Sweep.find_unfinished(self.db, stale_before=stale_before):
+            # Pick up an interrupted sweep straight away instead of waiting an interval;
+            # one another process is still heartbeating is left to that process
+            job_options['next_run_time'] = datetime.now()
+        
         self.scheduler.add_job(
             self.check_all_prices,
             'interval',
             seconds=Config.PRICE_CHECK_INTERVAL,
-            id='price_check_job'
+            id='price_check_job',
+            **job_options
+        )
+        
+        # Re-verify stale short links off the request path
+        self.scheduler.add_job(
+            self.resolver.refresh_stale,
+            'interval',
+            seconds=Config.SHORT_LINK_REFRESH_INTERVAL,
+            id='short_link_refresh_job'
         )
         
         self.scheduler.start()
@@ -1,10 +1,195 @@
 import requests
 from bs4 import BeautifulSoup
+import multiprocessing
+import os
 import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
+from config import Config
+import structured_data
+from price_index import product_code
+
+# ==================== PARSE STAGE ====================
+# Parsers are module-level so they can run in worker processes. Each takes the
+# raw page bytes and returns the same result dict scrape() has always returned.
+
+def parse_amazon(content):
+    """Extract title and price from an Amazon product page"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # Extract title
+    title_elem = soup.find('span', {'id': 'productTitle'})
+    title = title_elem.text.strip() if title_elem else 'Amazon Product'
+    
+    # Extract price - try multiple selectors
+    price = None
+    
+    # Method 1: Whole price
+    price_whole = soup.find('span', {'class': 'a-price-whole'})
+    price_fraction = soup.find('span', {'class': 'a-price-fraction'})
+    
+    if price_whole:
+        price_str = price_whole.text.replace(',', '').replace('.', '')
+        if price_fraction:
+            price_str += '.' + price_fraction.text
+        try:
+            price = float(price_str)
+        except:
+            pass
+    
+    # Method 2: Try other common Amazon price classes
+    if not price:
+        price_elem = soup.find('span', {'class': 'a-price'})
+        if price_elem:
+            price_text = price_elem.find('span', {'class': 'a-offscreen'})
+            if price_text:
+                price_str = re.sub(r'[^\d.]', '', price_text.text)
+                if price_str:
+                    try:
+                        price = float(price_str)
+                    except:
+                        pass
+    
+    if price:
+        return {
+            'success': True,
+            'title': title[:200],  # Limit title length
+            'price': price,
+            'site': 'amazon'
+        }
+    else:
+        return {
+            'success': False,
+            'error': 'Could not extract price from Amazon page. The page structure may have changed.'
+        }
+
+def parse_flipkart(content):
+    """Extract title and price from a Flipkart product page"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # Extract title - try multiple selectors
+    title = 'Flipkart Product'
+    title_selectors = [
+        {'class': 'VU-ZEz'},
+        {'class': 'B_NuCI'},
+        {'class': 'yhB1nd'},
+        {'class': 'G6XhRU'}
+    ]
+    
+    for selector in title_selectors:
+        title_elem = soup.find('span', selector)
+        if title_elem:
+            title = title_elem.text.strip()
+            break
+    
+    # Extract price - try multiple selectors
+    price = None
+    
+    # Common Flipkart price classes (updated)
+    price_selectors = [
+        ('div', {'class': 'Nx9bqj CxhGGd'}),
+        ('div', {'class': '_30jeq3 _16Jk6d'}),
+        ('div', {'class': '_30jeq3'}),
+        ('div', {'class': '_25b18c'}),
+        ('div', {'class': 'Nx9bqj'}),
+    ]
+    
+    for tag, selector in price_selectors:
+        price_elem = soup.find(tag, selector)
+        if price_elem:
+            price_text = re.sub(r'[^\d.]', '', price_elem.text)
+            if price_text:
+                try:
+                    price = float(price_text)
+                    break
+                except:
+                    pass
+    
+    if price:
+        return {
+            'success': True,
+            'title': title[:200],
+            'price': price,
+            'site': 'flipkart'
+        }
+    else:
+        return {
+            'success': False,
+            'error': 'Could not extract price from Flipkart page. Try using the full product URL instead of the short link.'
+        }
+
+PARSERS = {
+    'amazon': parse_amazon,
+    'flipkart': parse_flipkart,
+}
+
+def parse_context():
+    """Start method for parse workers; never fork this process
+    
+    Forking would copy the scheduler/sweep threads' locks into the children.
+    forkserver is preferred; where it doesn't exist (Windows) spawn is used.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['scraper'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+class ParseStage:
+    """Pool of worker processes that parse fetched pages off the GIL
+    
+    At most `max_pending` pages are queued or being parsed at once; fetch
+    threads block until a slot frees up, which keeps memory bounded.
+    """
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = threading.BoundedSemaphore(max_pending or self.workers * 2)
+        self.lock = threading.Lock()
+        self.executor = None
+    
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=parse_context())
+            return self.executor
+    
+    def parse(self, site, content):
+        with self.slots:
+            executor = self.get_executor()
+            try:
+                return executor.submit(PARSERS[site], content).result()
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool next time and parse this page here
+                with self.lock:
+                    if self.executor is executor:
+                        self.executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                return PARSERS[site](content)
+    
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+# Shared by every PriceScraper in the process; PARSE_WORKERS = 0 parses inline
+parse_stage = ParseStage(Config.PARSE_WORKERS, Config.PARSE_QUEUE_SIZE) if Config.PARSE_WORKERS != 0 else None
+
+# ==================== FETCH STAGE ====================
+
+# Per-site cap on concurrent requests, shared by every PriceScraper in the process
+site_slots = {
+    site: threading.BoundedSemaphore(limit)
+    for site, limit in Config.SITE_CONCURRENCY.items()
+}
 
 class PriceScraper:
-    def __init__(self):
+    def __init__(self, resolver=None):
+        # Optional ShortLinkResolver used to skip short-link redirects on every fetch
+        self.resolver = resolver
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept-Language': 'en-US,en;q=0.9',
@@ -26,9 +211,12 @@ class PriceScraper:
     
     def scrape(self, url):
         """Main scraping method that routes to specific scrapers"""
-        site = self.get_site_source(url)
-        
         try:
+            if self.resolver:
+                url = self.resolver.resolve(url)
+            
+            site = self.get_site_source(url)
+            
             if site == 'amazon':
                 return self.scrape_amazon(url)
             elif site == 'flipkart':
@@ -44,65 +232,40 @@ class PriceScraper:
                 'error': f'Scraping failed: {str(e)}'
             }
     
+    def fetch(self, site, url, headers, timeout, delay=0):
+        """Download a page's raw bytes within the site's concurrency limit"""
+        with site_slots[site]:
+            if delay:
+                time.sleep(delay)
+            response = requests.get(url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            return response.content
+    
+    def parse(self, site, content, url=None):
+        """Extract from embedded structured data, falling back to the DOM parse stage"""
+        result = structured_data.extract(site, content, product_code(url) if url else None)
+        if result:
+            structured_data.extraction_stats.record(site, 'structured')
+            return result
+        
+        if parse_stage is None:
+            result = PARSERS[site](content)
+        else:
+            result = parse_stage.parse(site, content)
+        structured_data.extraction_stats.record(site, 'dom' if result['success'] else 'failed')
+        return result
+    
     def scrape_amazon(self, url):
         """Scrape Amazon product page"""
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract title
-            title_elem = soup.find('span', {'id': 'productTitle'})
-            title = title_elem.text.strip() if title_elem else 'Amazon Product'
-            
-            # Extract price - try multiple selectors
-            price = None
-            
-            # Method 1: Whole price
-            price_whole = soup.find('span', {'class': 'a-price-whole'})
-            price_fraction = soup.find('span', {'class': 'a-price-fraction'})
-            
-            if price_whole:
-                price_str = price_whole.text.replace(',', '').replace('.', '')
-                if price_fraction:
-                    price_str += '.' + price_fraction.text
-                try:
-                    price = float(price_str)
-                except:
-                    pass
-            
-            # Method 2: Try other common Amazon price classes
-            if not price:
-                price_elem = soup.find('span', {'class': 'a-price'})
-                if price_elem:
-                    price_text = price_elem.find('span', {'class': 'a-offscreen'})
-                    if price_text:
-                        price_str = re.sub(r'[^\d.]', '', price_text.text)
-                        if price_str:
-                            try:
-                                price = float(price_str)
-                            except:
-                                pass
-            
-            if price:
-                return {
-                    'success': True,
-                    'title': title[:200],  # Limit title length
-                    'price': price,
-                    'site': 'amazon'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'Could not extract price from Amazon page. The page structure may have changed.'
-                }
-                
+            content = self.fetch('amazon', url, self.headers, timeout=10)
         except requests.RequestException as e:
             return {
                 'success': False,
                 'error': f'Failed to fetch Amazon page: {str(e)}'
             }
+        
+        return self.parse('amazon', content, url)
     
     def scrape_flipkart(self, url):
         """Scrape Flipkart product page"""
@@ -122,65 +285,7 @@ class PriceScraper:
         
         try:
             # Add a small delay to avoid rate limiting
-            import time
-            time.sleep(1)
-            
-            response = requests.get(url, headers=flipkart_headers, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract title - try multiple selectors
-            title = 'Flipkart Product'
-            title_selectors = [
-                {'class': 'VU-ZEz'},
-                {'class': 'B_NuCI'},
-                {'class': 'yhB1nd'},
-                {'class': 'G6XhRU'}
-            ]
-            
-            for selector in title_selectors:
-                title_elem = soup.find('span', selector)
-                if title_elem:
-                    title = title_elem.text.strip()
-                    break
-            
-            # Extract price - try multiple selectors
-            price = None
-            
-            # Common Flipkart price classes (updated)
-            price_selectors = [
-                ('div', {'class': 'Nx9bqj CxhGGd'}),
-                ('div', {'class': '_30jeq3 _16Jk6d'}),
-                ('div', {'class': '_30jeq3'}),
-                ('div', {'class': '_25b18c'}),
-                ('div', {'class': 'Nx9bqj'}),
-            ]
-            
-            for tag, selector in price_selectors:
-                price_elem = soup.find(tag, selector)
-                if price_elem:
-                    price_text = re.sub(r'[^\d.]', '', price_elem.text)
-                    if price_text:
-                        try:
-                            price = float(price_text)
-                            break
-                        except:
-                            pass
-            
-            if price:
-                return {
-                    'success': True,
-                    'title': title[:200],
-                    'price': price,
-                    'site': 'flipkart'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'Could not extract price from Flipkart page. Try using the full product URL instead of the short link.'
-                }
-                
+            content = self.fetch('flipkart', url, flipkart_headers, timeout=15, delay=1)
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 429:
                 return {
@@ -196,6 +301,8 @@ class PriceScraper:
                 'success': False,
                 'error': f'Failed to fetch Flipkart page: {str(e)}'
             }
+        
+        return self.parse('flipkart', content, url)
 
 # Test function
 if __name__ == '__main__':
@@ -204,4 +311,4 @@ if __name__ == '__main__':
     # Test with sample URLs
     test_url = input("Enter Amazon or Flipkart product URL: ")
     result = scraper.scrape(test_url)
-    print(result)
\ No newline at end of file
+    print(result)
@@ -0,0 +1,334 @@
+"""Storage backends selected from Config.DATABASE_URL.
+
+Queries are written once with `?` placeholders; each backend adapts them to
+its driver. Rows always come back as plain dicts.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteBackend:
+    """Single shared sqlite3 connection guarded by a lock"""
+    name = 'sqlite'
+    IntegrityError = sqlite3.IntegrityError
+
+    SCHEMA = [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            site_source TEXT,
+            product_title TEXT,
+            current_price REAL,
+            target_price REAL NOT NULL,
+            last_checked TIMESTAMP,
+            is_active INTEGER DEFAULT 1,
+            alert_sent INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS product_list_versions (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS short_links (
+            short_url TEXT PRIMARY KEY,
+            resolved_url TEXT NOT NULL,
+            canonical_url TEXT NOT NULL,
+            resolved_at TIMESTAMP,
+            verified_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sweeps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP,
+            last_product_id INTEGER,
+            last_product_checked TIMESTAMP,
+            products_checked INTEGER DEFAULT 0,
+            overrun_seconds REAL,
+            owner TEXT,
+            heartbeat_at TIMESTAMP,
+            running INTEGER
+        )
+        ''',
+        # running is 1 until the sweep finishes, so only one can be unfinished
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_sweeps_running ON sweeps (running)',
+    ]
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        self.lock = threading.RLock()
+
+    def create_tables(self):
+        with self.transaction() as tx:
+            for statement in self.SCHEMA:
+                tx.execute(statement)
+
+    @contextmanager
+    def transaction(self):
+        """Run several statements and commit them together"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            try:
+                yield _SQLiteTransaction(cursor)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def fetchone(self, query, params=()):
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+            return dict(row) if row else None
+
+    def fetchall(self, query, params=()):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query, params).fetchall()]
+
+    def execute(self, query, params=()):
+        with self.transaction() as tx:
+            return tx.execute(query, params)
+
+    def insert(self, query, params=()):
+        with self.transaction() as tx:
+            return tx.insert(query, params)
+
+    def executemany(self, query, seq_of_params):
+        with self.transaction() as tx:
+            return tx.executemany(query, seq_of_params)
+
+    def update_prices(self, rows):
+        """Write back (product_id, price, checked_at) tuples in one transaction"""
+        return self.executemany(
+            'UPDATE products SET current_price = ?, last_checked = ? WHERE id = ?',
+            [(price, checked_at, product_id) for product_id, price, checked_at in rows]
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+class _SQLiteTransaction:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        self.cursor.execute(query, params)
+        return self.cursor.rowcount
+
+    def insert(self, query, params=()):
+        self.cursor.execute(query, params)
+        return self.cursor.lastrowid
+
+    def executemany(self, query, seq_of_params):
+        self.cursor.executemany(query, seq_of_params)
+        return self.cursor.rowcount
+
+    def fetchone(self, query, params=()):
+        row = self.cursor.execute(query, params).fetchone()
+        return dict(row) if row else None
+
+    def fetchall(self, query, params=()):
+        return [dict(row) for row in self.cursor.execute(query, params).fetchall()]
+
+
+class PostgresBackend:
+    """Bounded psycopg connection pool with server-side prepared statements"""
+    name = 'postgresql'
+
+    SCHEMA = [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS products (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            url TEXT NOT NULL,
+            site_source TEXT,
+            product_title TEXT,
+            current_price DOUBLE PRECISION,
+            target_price DOUBLE PRECISION NOT NULL,
+            last_checked TIMESTAMP,
+            is_active INTEGER DEFAULT 1,
+            alert_sent INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS product_list_versions (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS short_links (
+            short_url TEXT PRIMARY KEY,
+            resolved_url TEXT NOT NULL,
+            canonical_url TEXT NOT NULL,
+            resolved_at TIMESTAMP,
+            verified_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sweeps (
+            id SERIAL PRIMARY KEY,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP,
+            last_product_id INTEGER,
+            last_product_checked TIMESTAMP,
+            products_checked INTEGER DEFAULT 0,
+            overrun_seconds DOUBLE PRECISION,
+            owner TEXT,
+            heartbeat_at TIMESTAMP,
+            running INTEGER
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_sweeps_running ON sweeps (running)',
+        'CREATE INDEX IF NOT EXISTS idx_products_user_active ON products (user_id, is_active)',
+    ]
+
+    def __init__(self, conninfo, min_size=1, max_size=10, timeout=30):
+        try:
+            from psycopg import IntegrityError
+            from psycopg.rows import dict_row
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            raise RuntimeError(
+                'PostgreSQL support requires the psycopg and psycopg-pool packages'
+            ) from e
+
+        self.IntegrityError = IntegrityError
+
+        # Callers block for up to `timeout` seconds once max_size connections are checked out
+        self.pool = ConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            kwargs={'row_factory': dict_row},
+            open=True
+        )
+
+    def create_tables(self):
+        with self.transaction() as tx:
+            for statement in self.SCHEMA:
+                tx.execute(statement, prepare=False)
+
+    @contextmanager
+    def transaction(self):
+        """Run several statements on one pooled connection and commit them together"""
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                yield _PostgresTransaction(conn)
+
+    def fetchone(self, query, params=()):
+        with self.transaction() as tx:
+            return tx.fetchone(query, params)
+
+    def fetchall(self, query, params=()):
+        with self.transaction() as tx:
+            return tx.fetchall(query, params)
+
+    def execute(self, query, params=()):
+        with self.transaction() as tx:
+            return tx.execute(query, params)
+
+    def insert(self, query, params=()):
+        with self.transaction() as tx:
+            return tx.insert(query, params)
+
+    def executemany(self, query, seq_of_params):
+        with self.transaction() as tx:
+            return tx.executemany(query, seq_of_params)
+
+    def update_prices(self, rows):
+        """Write back (product_id, price, checked_at) tuples with a single statement"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        values = ', '.join(['(?::integer, ?::double precision, ?::timestamp)'] * len(rows))
+        params = [value for row in rows for value in row]
+        with self.transaction() as tx:
+            return tx.execute(
+                f'''UPDATE products AS p
+                    SET current_price = v.price, last_checked = v.checked_at
+                    FROM (VALUES {values}) AS v(id, price, checked_at)
+                    WHERE p.id = v.id''',
+                params,
+                prepare=False
+            )
+
+    def close(self):
+        self.pool.close()
+
+
+class _PostgresTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @staticmethod
+    def adapt(query):
+        return query.replace('?', '%s')
+
+    def execute(self, query, params=(), prepare=True):
+        return self.conn.execute(self.adapt(query), params, prepare=prepare).rowcount
+
+    def insert(self, query, params=()):
+        row = self.conn.execute(self.adapt(query) + ' RETURNING id', params, prepare=True).fetchone()
+        return row['id']
+
+    def executemany(self, query, seq_of_params):
+        with self.conn.cursor() as cursor:
+            cursor.executemany(self.adapt(query), seq_of_params)
+            return cursor.rowcount
+
+    def fetchone(self, query, params=()):
+        return self.conn.execute(self.adapt(query), params, prepare=True).fetchone()
+
+    def fetchall(self, query, params=()):
+        return self.conn.execute(self.adapt(query), params, prepare=True).fetchall()
+
+
+def create_backend(database_url, pool_min_size=1, pool_max_size=10):
+    """Pick a storage backend from a SQLAlchemy-style DATABASE_URL"""
+    scheme, sep, rest = database_url.partition('://')
+    if not sep:
+        raise ValueError(f'Invalid DATABASE_URL: {database_url}')
+
+    # Drop any "+driver" suffix, e.g. postgresql+psycopg://
+    dialect = scheme.split('+', 1)[0].lower()
+
+    if dialect == 'sqlite':
+        # sqlite:///relative.db and sqlite:////absolute/path.db
+        return SQLiteBackend(rest[1:] if rest.startswith('/') else rest)
+    elif dialect in ('postgresql', 'postgres'):
+        return PostgresBackend(
+            f'postgresql://{rest}',
+            min_size=pool_min_size,
+            max_size=pool_max_size
+        )
+    else:
+        raise ValueError(f'Unsupported database backend: {dialect}')
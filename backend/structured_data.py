@@ -0,0 +1,296 @@
+"""Fast price extraction from structured data embedded in product pages.
+
+Pages usually carry an application/ld+json Product/Offer block or a preloaded
+state blob. Both are located with byte-level scans of the raw response, so no
+HTML parse is needed when they are present. Callers fall back to the DOM
+selectors in scraper.py when this returns None.
+
+State blobs also hold carousel and ad products, so a state price is only
+accepted from the node that carries the page's own ASIN/pid.
+"""
+import codecs
+import html
+import json
+import re
+import threading
+
+# Embedded-state fields, tried after JSON-LD: keys naming a product's id and its price
+STATE_FIELDS = {
+    'amazon': {'id_keys': ('asin',), 'price_keys': ('priceAmount',)},
+    'flipkart': {'id_keys': ('productId', 'pid'), 'price_keys': ('finalPrice',)},
+}
+
+# How far around an id match to look for its enclosing JSON node
+STATE_WINDOW = 20000
+STATE_MAX_BRACES = 50
+
+# Runs of characters that may be undecoded UTF-8 bytes; anything invalid as
+# UTF-8 (a \u-escaped latin-1 character, say) keeps its character
+RAW_BYTES = re.compile('[\x80-\xff]+')
+codecs.register_error('keep_latin1', lambda e: (e.object[e.start:e.end].decode('latin-1'), e.end))
+
+OG_TITLE = re.compile(rb'<meta[^>]+property=["\']og:title["\'][^>]+content=["\']([^"\']+)["\']', re.IGNORECASE)
+
+DEFAULT_TITLES = {
+    'amazon': 'Amazon Product',
+    'flipkart': 'Flipkart Product',
+}
+
+
+def iter_json_ld(content):
+    """Yield every decodable application/ld+json block in the page"""
+    pos = content.find(b'application/ld+json')
+    while pos != -1:
+        start = content.find(b'>', pos) + 1
+        end = content.find(b'</script>', start)
+        if start == 0 or end == -1:
+            return
+        try:
+            yield json.loads(content[start:end])
+        except ValueError:
+            pass
+        pos = content.find(b'application/ld+json', end)
+
+
+def iter_nodes(data):
+    """Flatten JSON-LD lists and @graph containers into individual nodes"""
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from iter_nodes(data['@graph'])
+
+
+def is_type(node, name):
+    node_type = node.get('@type')
+    if isinstance(node_type, list):
+        return name in node_type
+    return node_type == name
+
+
+def to_price(value):
+    """Positive float from a number or a price string in either 1,299.00 or 1.299,00 style"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    if not isinstance(value, str):
+        return None
+
+    cleaned = re.sub(r'[^\d.,]', '', value)
+    if ',' in cleaned and '.' in cleaned:
+        # Whichever separator comes last is the decimal point
+        if cleaned.rfind(',') > cleaned.rfind('.'):
+            cleaned = cleaned.replace('.', '').replace(',', '.')
+        else:
+            cleaned = cleaned.replace(',', '')
+    elif ',' in cleaned:
+        # A lone comma followed by exactly two digits is a decimal comma (299,00);
+        # otherwise commas group thousands (1,299 and Indian 1,29,999)
+        whole, _, fraction = cleaned.rpartition(',')
+        if cleaned.count(',') == 1 and len(fraction) == 2:
+            cleaned = f'{whole}.{fraction}'
+        else:
+            cleaned = cleaned.replace(',', '')
+    elif cleaned.count('.') > 1:
+        cleaned = cleaned.replace('.', '')
+
+    try:
+        price = float(cleaned)
+    except ValueError:
+        return None
+    return price if price > 0 else None
+
+
+def offer_price(offers):
+    """Lowest usable price across an Offer, AggregateOffer or list of offers"""
+    prices = []
+    for offer in offers if isinstance(offers, list) else [offers]:
+        if not isinstance(offer, dict):
+            continue
+        price = to_price(offer.get('price')) or to_price(offer.get('lowPrice'))
+        if price:
+            prices.append(price)
+    return min(prices) if prices else None
+
+
+def node_codes(node):
+    """Product identifiers a JSON-LD node declares about itself"""
+    codes = set()
+    for key in ('sku', 'productID', 'mpn'):
+        if isinstance(node.get(key), str):
+            codes.add(node[key].strip().upper())
+    return codes
+
+
+def from_json_ld(content, code=None):
+    """(title, price) from a JSON-LD Product node, or None
+
+    When the page's product code is known, nodes that identify themselves as
+    a different product are skipped. Without a code the page must have
+    exactly one priced Product node.
+    """
+    found = []
+    for data in iter_json_ld(content):
+        for node in iter_nodes(data):
+            if not is_type(node, 'Product') or 'offers' not in node:
+                continue
+            codes = node_codes(node)
+            if code and codes and code not in codes:
+                continue
+            price = offer_price(node['offers'])
+            if price:
+                if code:
+                    return node.get('name'), price
+                found.append((node.get('name'), price))
+
+    # Without a code there is no telling the page product from an accessory
+    # or carousel entry, so only an unambiguous page is trusted
+    return found[0] if len(found) == 1 else None
+
+
+def find_values(data, keys):
+    """Yield (key, value) for every occurrence of `keys` anywhere inside data"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in keys:
+                yield key, value
+            yield from find_values(value, keys)
+    elif isinstance(data, list):
+        for item in data:
+            yield from find_values(item, keys)
+
+
+def state_price(value):
+    if isinstance(value, dict):
+        return to_price(value.get('value'))
+    return to_price(value)
+
+
+def product_node(text, position, fields, code):
+    """Innermost JSON object around `position` that holds a price for `code` only
+
+    Walks outwards through enclosing objects and stops as soon as one also
+    covers a different product, so carousel and ad prices are never taken.
+    """
+    decoder = json.JSONDecoder()
+    start = position
+    for _ in range(STATE_MAX_BRACES):
+        start = text.rfind('{', 0, start)
+        if start == -1:
+            return None
+        try:
+            node, end = decoder.raw_decode(text, start)
+        except ValueError:
+            continue
+        if end <= position or not isinstance(node, dict):
+            continue
+
+        codes = {str(v).upper() for _, v in find_values(node, fields['id_keys'])}
+        if codes - {code}:
+            return None
+        for _, value in find_values(node, fields['price_keys']):
+            price = state_price(value)
+            if price:
+                return node, price
+    return None
+
+
+def from_raw_bytes(text):
+    """Re-decode characters that came from raw UTF-8 bytes in the latin-1 window
+
+    Characters written as JSON \\u escapes were already decoded correctly by
+    the JSON parser and are left alone.
+    """
+    def repair(match):
+        return match.group().encode('latin-1').decode('utf-8', 'keep_latin1')
+    return RAW_BYTES.sub(repair, text)
+
+
+def from_state(site, content, code=None):
+    """(title, price) from the page product's node in a preloaded-state blob, or None"""
+    fields = STATE_FIELDS.get(site)
+    if not fields or not code:
+        return None
+
+    keys = b'|'.join(re.escape(k.encode()) for k in fields['id_keys'])
+    id_pattern = re.compile(rb'"(?:' + keys + rb')"\s*:\s*"' + re.escape(code.encode()) + rb'"', re.IGNORECASE)
+
+    # Every node for this product must agree; a sponsored copy with its own
+    # price makes the blob ambiguous, so the DOM decides instead
+    found = []
+    for match in id_pattern.finditer(content):
+        offset = max(0, match.start() - STATE_WINDOW)
+        # latin-1 maps bytes 1:1 to characters, so offsets stay valid
+        text = content[offset:match.end() + STATE_WINDOW].decode('latin-1')
+        node = product_node(text, match.start() - offset, fields, code)
+        if node:
+            found.append(node)
+
+    if not found or len({price for _, price in found}) > 1:
+        return None
+
+    node, price = found[0]
+    title = next((node[k] for k in ('title', 'name') if isinstance(node.get(k), str)), None)
+    if title:
+        title = from_raw_bytes(title)
+    else:
+        title_match = OG_TITLE.search(content)
+        title = title_match.group(1).decode('utf-8', 'replace') if title_match else None
+    return title, price
+
+
+def extract(site, content, code=None):
+    """Scrape result dict from structured data, or None to fall back to the DOM
+
+    `code` is the product's ASIN/pid from its URL; without it the state tier
+    is skipped because its price could belong to another product.
+    """
+    code = code.upper() if code else None
+    found = from_json_ld(content, code) or from_state(site, content, code)
+    if not found:
+        return None
+
+    title, price = found
+    title = html.unescape(title).strip() if title else DEFAULT_TITLES.get(site, 'Product')
+    return {
+        'success': True,
+        'title': title[:200],
+        'price': price,
+        'site': site
+    }
+
+
+class TierStats:
+    """Counts which extraction tier produced each result"""
+    TIERS = ('structured', 'dom', 'failed')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, site, tier):
+        with self.lock:
+            site_counts = self.counts.setdefault(site, dict.fromkeys(self.TIERS, 0))
+            site_counts[tier] += 1
+
+    def snapshot(self):
+        """Per-site counts and hit rates"""
+        with self.lock:
+            report = {}
+            for site, counts in self.counts.items():
+                total = sum(counts.values())
+                report[site] = {
+                    'total': total,
+                    'counts': dict(counts),
+                    'hit_rates': {
+                        tier: round(count / total, 3) if total else 0.0
+                        for tier, count in counts.items()
+                    }
+                }
+            return report
+
+
+extraction_stats = TierStats()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+
+import pytest
+
+# Backend modules import each other as top-level modules (from config import Config)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+class FakeScraper:
+    """Stands in for PriceScraper; results are looked up by URL"""
+
+    def __init__(self):
+        self.resolver = None
+        self.results = {}
+        self.calls = []
+
+    def scrape(self, url):
+        self.calls.append(url)
+        return self.results.get(url) or {
+            'success': True,
+            'title': f'Product at {url}',
+            'price': 500.0,
+            'site': 'amazon'
+        }
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py imported once against a scratch SQLite database, scheduler stopped"""
+    from config import Config
+    Config.DATABASE_URL = f"sqlite:///{tmp_path_factory.mktemp('api') / 'api.db'}"
+
+    import app as app_module
+    app_module.price_checker.stop()
+    return app_module
+
+
+@pytest.fixture
+def api(app_module, monkeypatch):
+    """Test client with a fake scraper and fan-out switched off"""
+    scraper = FakeScraper()
+    monkeypatch.setattr(app_module, 'scraper', scraper)
+    monkeypatch.setattr(app_module.price_checker, 'schedule_fan_out', lambda *args, **kwargs: None)
+    app_module.app.config['TESTING'] = True
+    client = app_module.app.test_client()
+    client.scraper = scraper
+    return client
+
+
+@pytest.fixture
+def user(app_module):
+    """A fresh user and its Authorization header"""
+    from auth import generate_token
+    from models import User
+
+    email = f'user-{uuid.uuid4().hex[:12]}@example.com'
+    user_id = User.create(app_module.db, email, 'password123')
+    return {
+        'id': user_id,
+        'email': email,
+        'headers': {'Authorization': f'Bearer {generate_token(user_id, email)}'}
+    }
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    """A PostgreSQL database for the backend-parametrised tests
+
+    Uses TEST_DATABASE_URL when set; otherwise starts a throwaway local
+    cluster with initdb/pg_ctl from PG_BIN or PATH, listening on a Unix
+    socket only, and stops it at the end of the session.
+    """
+    url = os.getenv('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+
+    search_path = os.getenv('PG_BIN') or os.environ.get('PATH')
+    initdb = shutil.which('initdb', path=search_path)
+    pg_ctl = shutil.which('pg_ctl', path=search_path)
+    if not (initdb and pg_ctl):
+        pytest.skip('PostgreSQL not tested: set TEST_DATABASE_URL, or put initdb/pg_ctl on PATH or in PG_BIN')
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        pytest.skip('PostgreSQL not tested: initdb refuses to run as root; set TEST_DATABASE_URL instead')
+
+    base = tmp_path_factory.mktemp('postgres')
+    data, socket_dir = base / 'data', base / 'socket'
+    socket_dir.mkdir()
+    subprocess.run(
+        [initdb, '-D', str(data), '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+        check=True, capture_output=True
+    )
+    subprocess.run(
+        [pg_ctl, '-D', str(data), '-l', str(base / 'postgres.log'), '-w', 'start',
+         '-o', f"-k {socket_dir} -c listen_addresses=''"],
+        check=True, capture_output=True
+    )
+    try:
+        yield f'postgresql://postgres@/postgres?host={socket_dir}'
+    finally:
+        subprocess.run([pg_ctl, '-D', str(data), '-m', 'fast', 'stop'], capture_output=True)
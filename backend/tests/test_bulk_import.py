@@ -0,0 +1,106 @@
+"""POST /api/products/bulk: validation, quota and the NDJSON stream."""
+import json
+
+from config import Config
+from models import Product
+
+
+def item(n, target_price=100.0):
+    return {'url': f'https://www.amazon.in/dp/B0BULK{n:04d}', 'target_price': target_price}
+
+
+def post_bulk(api, user, items):
+    response = api.post('/api/products/bulk', json={'items': items}, headers=user['headers'])
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(text) for text in response.get_data(as_text=True).splitlines()]
+    assert 'summary' in lines[-1]
+    return {l['index']: l for l in lines if 'index' in l}, lines[-1]['summary'], lines
+
+
+def fail(api, url):
+    api.scraper.results[url] = {'success': False, 'error': 'Blocked'}
+
+
+def test_rejects_invalid_requests(api, user):
+    assert api.post('/api/products/bulk', json={'items': []}, headers=user['headers']).status_code == 400
+
+    too_many = [item(n) for n in range(Config.BULK_IMPORT_MAX_ITEMS + 1)]
+    assert api.post('/api/products/bulk', json={'items': too_many}, headers=user['headers']).status_code == 400
+
+
+def test_streams_a_line_per_item_and_a_summary(api, user):
+    results, summary, _ = post_bulk(api, user, [
+        item(1),
+        {'url': 'not-a-url', 'target_price': 10},
+        {'url': 'https://www.amazon.in/dp/B0BULK0003', 'target_price': -5},
+    ])
+
+    assert results[0]['success'] and results[0]['product']['current_price'] == 500.0
+    assert results[1]['error'] == 'Invalid URL format'
+    assert results[2]['error'] == 'Target price must be a positive number'
+    assert summary == {'added': 1, 'failed': 2}
+
+
+def test_failed_scrapes_do_not_use_quota_slots(api, user):
+    items = [item(n) for n in range(8)]
+    fail(api, items[0]['url'])
+    fail(api, items[1]['url'])
+
+    results, summary, _ = post_bulk(api, user, items)
+
+    assert [i for i in range(8) if results[i]['success']] == [2, 3, 4, 5, 6]
+    assert results[7]['error'].startswith('You have reached the maximum limit')
+    assert summary == {'added': Config.MAX_PRODUCTS_PER_USER, 'failed': 3}
+
+
+def test_stops_scraping_once_the_quota_is_filled(api, user):
+    items = [item(n) for n in range(200)]
+    fail(api, items[1]['url'])
+
+    results, summary, _ = post_bulk(api, user, items)
+
+    # Five slots: one wave of five, then one more for the failed scrape
+    assert len(api.scraper.calls) == Config.MAX_PRODUCTS_PER_USER + 1
+    assert summary == {'added': Config.MAX_PRODUCTS_PER_USER, 'failed': 195}
+    assert all(not results[i]['success'] for i in range(6, 200))
+
+
+def test_no_free_slots_means_no_scrapes(api, app_module, user):
+    post_bulk(api, user, [item(n) for n in range(Config.MAX_PRODUCTS_PER_USER)])
+    api.scraper.calls.clear()
+
+    _, summary, _ = post_bulk(api, user, [item(100), item(101)])
+
+    assert api.scraper.calls == []
+    assert summary == {'added': 0, 'failed': 2}
+
+
+def test_quota_is_rechecked_when_inserting(api, app_module, user, monkeypatch):
+    # Another import fills four slots while this one is scraping
+    def count_then_race(db, user_id):
+        Product.create_many(db, user_id, [
+            {'url': f'https://www.amazon.in/dp/B0RACE{n:04d}', 'target_price': 1.0,
+             'site_source': 'amazon', 'product_title': 'Other', 'current_price': 5.0}
+            for n in range(4)
+        ])
+        return 0
+    monkeypatch.setattr(Product, 'count_user_products', staticmethod(count_then_race))
+
+    results, summary, _ = post_bulk(api, user, [item(n) for n in range(3)])
+
+    assert results[0]['success']
+    assert not results[1]['success'] and not results[2]['success']
+    assert summary == {'added': 1, 'failed': 2}
+    assert len(Product.get_user_products(app_module.db, user['id'])) == Config.MAX_PRODUCTS_PER_USER
+
+
+def test_errors_after_the_stream_starts_end_with_a_summary(api, user, monkeypatch):
+    def broken(db, user_id):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(Product, 'count_user_products', staticmethod(broken))
+
+    _, summary, lines = post_bulk(api, user, [item(1), item(2)])
+
+    assert lines[0] == {'error': 'Failed to start import: database is locked'}
+    assert summary == {'added': 0, 'failed': 2}
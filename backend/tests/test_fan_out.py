@@ -0,0 +1,37 @@
+"""Alert fan-out for prices learned outside a sweep."""
+from models import Product
+from price_index import item_key, target_index
+
+
+def watch(db, user_id, url, target_price):
+    return Product.create(db, user_id, url, target_price, 'amazon', 'Watched', 900.0)
+
+
+def test_fan_out_alerts_indexed_watchers(app_module, user, monkeypatch):
+    url = 'https://www.amazon.in/dp/B0FANOUT01'
+    reached = watch(app_module.db, user['id'], url, 500.0)
+    watch(app_module.db, user['id'], url, 300.0)
+    alerted = []
+    monkeypatch.setattr(app_module.price_checker, 'send_alert', lambda p, price: alerted.append(p['id']))
+
+    app_module.price_checker.fan_out(url, 450.0)
+
+    assert alerted == [reached]
+
+
+def test_fan_out_scans_rows_for_items_over_the_index_cap(app_module, user, monkeypatch):
+    url = 'https://www.amazon.in/dp/B0FANOUT02'
+    reached = watch(app_module.db, user['id'], url, 500.0)
+    watch(app_module.db, user['id'], url, 300.0)
+    watch(app_module.db, user['id'], 'https://www.amazon.in/dp/B0FANOUT03', 500.0)
+    excluded = watch(app_module.db, user['id'], url, 800.0)
+    # As if the memory cap had been hit for this item
+    with target_index.lock:
+        target_index._drop_item(item_key(url))
+    assert target_index.triggered(item_key(url), 450.0) is None
+    alerted = []
+    monkeypatch.setattr(app_module.price_checker, 'send_alert', lambda p, price: alerted.append(p['id']))
+
+    app_module.price_checker.fan_out(url, 450.0, exclude_ids={excluded})
+
+    assert alerted == [reached]
@@ -0,0 +1,138 @@
+"""GET /api/products: pagination, ETags, gzip and cache invalidation."""
+import gzip
+
+import pytest
+
+from config import Config
+from models import Database, Product
+from response_cache import ProductListCache
+
+
+def add_products(db, user_id, count, title='Product'):
+    return [
+        Product.create(
+            db, user_id, f'https://www.amazon.in/dp/B0API{user_id:03d}{i:02d}',
+            100.0, 'amazon', f'{title} {i}', 150.0
+        )
+        for i in range(count)
+    ]
+
+
+def test_lists_products_with_strong_etag(api, app_module, user):
+    ids = add_products(app_module.db, user['id'], 3)
+
+    response = api.get('/api/products', headers=user['headers'])
+
+    assert response.status_code == 200
+    assert [p['id'] for p in response.get_json()['products']] == ids
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_matching_if_none_match_gets_304(api, app_module, user):
+    add_products(app_module.db, user['id'], 2)
+    etag = api.get('/api/products', headers=user['headers']).get_etag()[0]
+
+    response = api.get('/api/products', headers={**user['headers'], 'If-None-Match': f'"{etag}"'})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.get_etag()[0] == etag
+
+
+def test_large_responses_are_gzipped_with_their_own_etag(api, app_module, user, monkeypatch):
+    monkeypatch.setattr(Config, 'COMPRESS_MIN_BYTES', 10)
+    add_products(app_module.db, user['id'], 3)
+    plain = api.get('/api/products', headers=user['headers'])
+
+    response = api.get('/api/products', headers={**user['headers'], 'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+    assert response.get_etag()[0] == plain.get_etag()[0] + '-gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_small_responses_are_not_compressed(api, app_module, user):
+    response = api.get('/api/products', headers={**user['headers'], 'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_cursor_pagination(api, app_module, user):
+    ids = add_products(app_module.db, user['id'], 5)
+
+    first = api.get('/api/products?limit=2', headers=user['headers']).get_json()
+    second = api.get(f"/api/products?limit=2&cursor={first['next_cursor']}", headers=user['headers']).get_json()
+    last = api.get(f"/api/products?limit=2&cursor={second['next_cursor']}", headers=user['headers']).get_json()
+
+    pages = [first, second, last]
+    assert [p['id'] for page in pages for p in page['products']] == ids
+    assert last['next_cursor'] is None
+
+
+@pytest.mark.parametrize('query', [
+    'limit=0',
+    f'limit={Config.PRODUCT_PAGE_MAX_LIMIT + 1}',
+    'limit=abc',
+    'cursor=-1',
+    'cursor=1.5',
+])
+def test_rejects_bad_limit_and_cursor(api, user, query):
+    response = api.get(f'/api/products?{query}', headers=user['headers'])
+
+    assert response.status_code == 400
+    assert 'limit must be between' in response.get_json()['error']
+
+
+def test_adding_a_product_changes_the_etag(api, app_module, user):
+    add_products(app_module.db, user['id'], 1)
+    before = api.get('/api/products', headers=user['headers']).get_etag()[0]
+
+    Product.create(app_module.db, user['id'], 'https://www.amazon.in/dp/B0APINEW01', 10.0, 'amazon', 'New', 20.0)
+    response = api.get('/api/products', headers={**user['headers'], 'If-None-Match': f'"{before}"'})
+
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 2
+
+
+def test_writes_from_another_process_are_seen(api, app_module, user):
+    ids = add_products(app_module.db, user['id'], 2)
+    before = api.get('/api/products', headers=user['headers'])
+
+    # A separate connection stands in for the scheduler or another API worker
+    other = Database()
+    try:
+        Product.update_prices(other, {ids[0]: 99.0})
+        Product.mark_alert_sent(other, ids[1])
+    finally:
+        other.backend.close()
+
+    response = api.get('/api/products', headers={**user['headers'], 'If-None-Match': before.headers['ETag']})
+
+    assert response.status_code == 200
+    products = {p['id']: p for p in response.get_json()['products']}
+    assert products[ids[0]]['current_price'] == 99.0
+    assert products[ids[1]]['alert_sent'] == 1
+
+
+def test_cache_bounds_pages_per_user():
+    cache = ProductListCache(max_users=2, max_pages=3)
+
+    for cursor in range(1000):
+        cache.put(1, (cursor, 10), b'{}', version=0)
+
+    assert len(cache) == 3
+    assert cache.get(1, (999, 10), version=0) is not None
+    assert cache.get(1, (0, 10), version=0) is None
+
+
+def test_cache_drops_pages_from_an_older_version():
+    cache = ProductListCache(max_users=2, max_pages=3)
+    cache.put(1, (None, None), b'old', version=0)
+
+    assert cache.get(1, (None, None), version=1) is None
+    cache.put(1, (None, 10), b'new', version=1)
+    assert len(cache) == 1
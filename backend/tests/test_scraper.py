@@ -0,0 +1,28 @@
+"""Parse stage worker processes."""
+import multiprocessing
+
+import pytest
+
+import scraper
+
+
+def test_parse_workers_use_forkserver_where_available():
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        pytest.skip('forkserver is not available on this platform')
+    assert scraper.parse_context().get_start_method() == 'forkserver'
+
+
+def test_parse_workers_fall_back_to_spawn_without_forkserver(monkeypatch):
+    # Windows only offers spawn
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    assert scraper.parse_context().get_start_method() == 'spawn'
+
+
+def test_parse_stage_parses_in_worker_processes():
+    stage = scraper.ParseStage(workers=1)
+    try:
+        result = stage.parse('amazon', b'<span class="a-price-whole">1,299</span>')
+    finally:
+        stage.shutdown()
+    assert result['price'] == 1299.0
+
@@ -0,0 +1,239 @@
+"""Model queries run against every storage backend.
+
+SQLite always runs. PostgreSQL runs against TEST_DATABASE_URL, e.g.
+postgresql://postgres@localhost/price_tracker_test, or else a local
+cluster started by the postgres_url fixture in conftest.py; its tables are
+dropped and recreated for every test.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from link_resolver import ShortLinkResolver
+from models import Database, Product, Sweep, User
+from price_index import item_key, target_index
+from storage import create_backend
+
+
+def reset_postgres(url):
+    backend = create_backend(url)
+    try:
+        with backend.transaction() as tx:
+            tx.execute('DROP TABLE IF EXISTS sweeps, short_links, product_list_versions, products, users CASCADE', prepare=False)
+    finally:
+        backend.close()
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def db(request, tmp_path, monkeypatch):
+    if request.param == 'sqlite':
+        url = f'sqlite:///{tmp_path / "test.db"}'
+    else:
+        url = request.getfixturevalue('postgres_url')
+        reset_postgres(url)
+
+    monkeypatch.setattr(Config, 'DATABASE_URL', url)
+    database = Database()
+    yield database
+    database.backend.close()
+
+
+def add_products(db, user_id, count):
+    return Product.create_many(db, user_id, [
+        {
+            'url': f'https://www.amazon.in/dp/B0TEST{i:04d}',
+            'target_price': 100.0,
+            'site_source': 'amazon',
+            'product_title': f'Product {i}',
+            'current_price': 150.0
+        }
+        for i in range(count)
+    ])
+
+
+def test_user_insert_returns_id(db):
+    first = User.create(db, 'a@example.com', 'secret')
+    second = User.create(db, 'b@example.com', 'secret')
+
+    assert second > first
+    user = User.find_by_email(db, 'b@example.com')
+    assert user['id'] == second
+    assert User.verify_password(user['password_hash'], 'secret')
+
+
+def test_duplicate_email_raises_backend_integrity_error(db):
+    User.create(db, 'a@example.com', 'secret')
+    with pytest.raises(db.IntegrityError):
+        User.create(db, 'a@example.com', 'other')
+
+
+def test_transaction_rolls_back(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    with pytest.raises(RuntimeError):
+        with db.transaction() as tx:
+            tx.insert(
+                'INSERT INTO products (user_id, url, target_price) VALUES (?, ?, ?)',
+                (user_id, 'https://www.amazon.in/dp/B0TEST0000', 10.0)
+            )
+            raise RuntimeError('abort')
+
+    assert Product.count_user_products(db, user_id) == 0
+
+
+def test_products_create_page_and_delete(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    ids = add_products(db, user_id, 5)
+
+    assert len(set(ids)) == 5
+    assert Product.count_user_products(db, user_id) == 5
+    first_page = Product.get_user_products(db, user_id, limit=2)
+    next_page = Product.get_user_products(db, user_id, after_id=first_page[-1]['id'], limit=10)
+    assert [p['id'] for p in first_page + next_page] == sorted(ids)
+    assert {p['id'] for p in Product.get_by_ids(db, ids[:3])} == set(ids[:3])
+
+    Product.delete(db, ids[0], user_id)
+    assert Product.count_user_products(db, user_id) == 4
+    assert Product.get_by_ids(db, [ids[0]]) == []
+
+
+def test_update_prices_writes_every_row(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    ids = add_products(db, user_id, 3)
+
+    Product.update_prices(db, {ids[0]: 90.0, ids[2]: 120.5})
+
+    prices = {p['id']: p['current_price'] for p in Product.get_by_ids(db, ids)}
+    assert prices == {ids[0]: 90.0, ids[1]: 150.0, ids[2]: 120.5}
+
+
+def test_prepared_queries_can_be_repeated(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    add_products(db, user_id, 2)
+
+    # The same statement text is reused from the pool's prepared statements
+    for _ in range(10):
+        assert Product.count_user_products(db, user_id) == 2
+
+
+def test_due_order_matches_the_query(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    ids = add_products(db, user_id, 4)
+    db.execute('UPDATE products SET last_checked = NULL WHERE id = ?', (ids[3],))
+    db.execute('UPDATE products SET last_checked = ? WHERE id = ?', (datetime.now() - timedelta(days=1), ids[2]))
+
+    due = Product.get_due_for_check(db)
+
+    assert [p['id'] for p in due][:2] == [ids[3], ids[2]]
+    assert sorted(due, key=Product.due_order) == due
+
+
+def test_only_one_sweep_can_be_unfinished(db):
+    sweep_id = Sweep.start(db, 'worker-a', datetime.now())
+
+    assert Sweep.start(db, 'worker-b', datetime.now()) is None
+    assert Sweep.find_unfinished(db)['id'] == sweep_id
+
+    assert Sweep.finish(db, sweep_id, 'worker-a', 0.0)
+    assert Sweep.find_unfinished(db) is None
+    assert Sweep.start(db, 'worker-b', datetime.now()) is not None
+
+
+def test_sweep_claim_respects_live_owner(db):
+    sweep_id = Sweep.start(db, 'worker-a', datetime.now())
+    long_ago = datetime.now() - timedelta(hours=1)
+
+    assert not Sweep.claim(db, sweep_id, 'worker-b', stale_before=long_ago)
+    assert Sweep.find_unfinished(db, stale_before=long_ago) is None
+    assert Sweep.heartbeat(db, sweep_id, 'worker-a')
+
+    # Once worker-a's heartbeat is older than the cutoff, worker-b may take over
+    later = datetime.now() + timedelta(seconds=1)
+    assert Sweep.find_unfinished(db, stale_before=later)['id'] == sweep_id
+    assert Sweep.claim(db, sweep_id, 'worker-b', stale_before=later)
+    assert not Sweep.heartbeat(db, sweep_id, 'worker-a')
+    assert not Sweep.finish(db, sweep_id, 'worker-a', 0.0)
+
+
+def test_sweep_checkpoint(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    ids = add_products(db, user_id, 2)
+    product = Product.get_by_ids(db, [ids[1]])[0]
+    sweep_id = Sweep.start(db, 'worker-a', datetime.now())
+
+    Sweep.checkpoint(db, sweep_id, 'worker-a', None, 3)
+    Sweep.checkpoint(db, sweep_id, 'worker-a', product, 2)
+    Sweep.checkpoint(db, sweep_id, 'worker-b', product, 100)
+
+    sweep = Sweep.find_unfinished(db)
+    assert sweep['products_checked'] == 5
+    assert sweep['last_product_id'] == ids[1]
+    resume_after = Product.due_order({'id': ids[1], 'last_checked': sweep['last_product_checked']})
+    assert resume_after == Product.due_order(product)
+
+
+def test_short_link_upsert(db, monkeypatch):
+    resolver = ShortLinkResolver(db)
+    resolver.store('https://amzn.in/d/abc', 'https://www.amazon.in/dp/B0TEST0001?ref=x')
+    resolver.store('https://amzn.in/d/abc', 'https://www.amazon.in/dp/B0TEST0002?ref=y')
+
+    rows = db.fetchall('SELECT * FROM short_links')
+    assert len(rows) == 1
+    assert rows[0]['resolved_url'] == 'https://www.amazon.in/dp/B0TEST0002?ref=y'
+    assert rows[0]['canonical_url'] == 'https://www.amazon.in/dp/B0TEST0002'
+
+    # A fresh resolver finds the mapping in the table without following the link
+    monkeypatch.setattr(ShortLinkResolver, 'follow', lambda self, url: None)
+    resolved = ShortLinkResolver(db).resolve_many(['https://amzn.in/d/abc', 'https://www.flipkart.com/x/p/itm1'])
+    assert resolved == {
+        'https://amzn.in/d/abc': 'https://www.amazon.in/dp/B0TEST0002?ref=y',
+        'https://www.flipkart.com/x/p/itm1': 'https://www.flipkart.com/x/p/itm1'
+    }
+
+
+def test_update_prices_reports_rows_written(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    ids = add_products(db, user_id, 3)
+
+    now = datetime.now()
+    assert db.update_prices([(product_id, 75.0, now) for product_id in ids]) == 3
+    assert db.update_prices([]) == 0
+
+
+def test_short_links_share_an_index_item_with_full_urls(db):
+    user_id = User.create(db, 'a@example.com', 'secret')
+    ShortLinkResolver(db).store('https://amzn.in/d/abc', 'https://www.amazon.in/Some-Name/dp/B0TEST0001?ref=x')
+    full_id = Product.create(db, user_id, 'https://www.amazon.in/dp/B0TEST0001', 100.0, 'amazon', 'P', 150.0)
+    short_id = Product.create(db, user_id, 'https://amzn.in/d/abc', 120.0, 'amazon', 'P', 150.0)
+
+    target_index.rebuild(db)
+
+    key = item_key('https://www.amazon.in/dp/B0TEST0001')
+    assert sorted(target_index.triggered(key, 110.0)) == [short_id]
+    assert sorted(target_index.triggered(key, 90.0)) == sorted([full_id, short_id])
+
+
+def test_refresh_stale_moves_past_dead_links(db, monkeypatch):
+    monkeypatch.setattr(Config, 'SHORT_LINK_REFRESH_BATCH', 2)
+    resolver = ShortLinkResolver(db)
+    links = [f'https://amzn.in/d/link{n}' for n in range(4)]
+    for n, link in enumerate(links):
+        resolver.store(link, f'https://www.amazon.in/dp/B0LINK000{n}')
+    # Oldest first: the two dead links were verified longest ago
+    long_ago = datetime.now() - timedelta(seconds=Config.SHORT_LINK_TTL + 3600)
+    for n, link in enumerate(links):
+        db.execute('UPDATE short_links SET verified_at = ? WHERE short_url = ?', (long_ago + timedelta(minutes=n), link))
+
+    followed = []
+    def follow(self, url):
+        followed.append(url)
+        return None if url in links[:2] else url.replace('amzn.in/d/', 'www.amazon.in/dp/B0NEW')
+    monkeypatch.setattr(ShortLinkResolver, 'follow', follow)
+
+    for _ in range(3):
+        resolver.refresh_stale()
+
+    assert followed == links
+    rows = {row['short_url']: row for row in db.fetchall('SELECT * FROM short_links')}
+    assert rows[links[0]]['resolved_url'] == 'https://www.amazon.in/dp/B0LINK0000'
+    assert rows[links[3]]['resolved_url'] == 'https://www.amazon.in/dp/B0NEWlink3'
@@ -0,0 +1,88 @@
+import pytest
+
+import structured_data
+from conftest import load_fixture
+
+
+def test_flipkart_state_skips_carousel_prices():
+    result = structured_data.extract('flipkart', load_fixture('flipkart_state_carousel.html'), 'MOBGYHZCKZJZVGHK')
+    assert result == {
+        'success': True,
+        'title': 'Samsung Galaxy M15 5G (Blue Topaz, 128 GB)',
+        'price': 15999.0,
+        'site': 'flipkart'
+    }
+
+
+def test_flipkart_state_with_conflicting_prices_falls_back_to_dom():
+    # A sponsored copy of the product carries a different price
+    assert structured_data.extract('flipkart', load_fixture('flipkart_state_conflicting.html'), 'MOBGYHZCKZJZVGHK') is None
+
+
+def test_state_tier_needs_product_code():
+    assert structured_data.extract('flipkart', load_fixture('flipkart_state_carousel.html')) is None
+
+
+def test_amazon_state_uses_buybox_for_page_asin():
+    result = structured_data.extract('amazon', load_fixture('amazon_state.html'), 'b0b5tglbt8')
+    assert result['success']
+    assert result['price'] == 1099.0
+
+
+def test_json_ld_picks_node_matching_product_code():
+    result = structured_data.extract('amazon', load_fixture('amazon_jsonld.html'), 'B08XYZ1234')
+    assert result['title'] == 'Bosch Akkuschrauber EasyDrill 18V'
+    assert result['price'] == 1299.0
+
+
+def test_json_ld_without_code_refuses_ambiguous_pages():
+    # The fixture also lists an accessory, so its price could be the wrong one
+    assert structured_data.extract('amazon', load_fixture('amazon_jsonld.html')) is None
+
+
+def test_json_ld_without_code_accepts_a_single_product():
+    content = (
+        b'<script type="application/ld+json">'
+        b'{"@type": "Product", "name": "Kettle", "offers": {"price": "1,499"}}'
+        b'</script>'
+    )
+    result = structured_data.extract('flipkart', content)
+    assert result['price'] == 1499.0
+
+
+@pytest.mark.parametrize('title, expected', [
+    ('"Caf\\u00e9 \\u20b9 Phone"'.encode(), 'Caf\u00e9 \u20b9 Phone'),
+    ('"Café ₹ Phone"'.encode('utf-8'), 'Caf\u00e9 \u20b9 Phone'),
+    ('"Caf\\u00e9 ₹ Phone"'.encode('utf-8'), 'Caf\u00e9 \u20b9 Phone'),
+])
+def test_state_titles_decode_escapes_and_raw_utf8(title, expected):
+    content = b'<script>window.__STATE__ = {"product": {"pid": "ABC123", "title": ' + title + b', "finalPrice": 999}};</script>'
+    result = structured_data.extract('flipkart', content, 'ABC123')
+    assert result['title'] == expected
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('1,299.00', 1299.0),
+    ('1.299,00', 1299.0),
+    ('₹1,29,999', 129999.0),
+    ('299,00', 299.0),
+    ('1.234.567', 1234567.0),
+    (15999, 15999.0),
+    ('0', None),
+    ('free', None),
+    (True, None),
+])
+def test_to_price(raw, expected):
+    assert structured_data.to_price(raw) == expected
+
+
+def test_scraper_falls_back_to_dom_when_state_is_ambiguous(monkeypatch):
+    import scraper
+    monkeypatch.setattr(scraper, 'parse_stage', None)
+
+    result = scraper.PriceScraper().parse(
+        'flipkart',
+        load_fixture('flipkart_state_conflicting.html'),
+        'https://www.flipkart.com/samsung-galaxy-m15/p/itm1d5d8a4e3f8e4?pid=MOBGYHZCKZJZVGHK'
+    )
+    assert result['price'] == 15999.0